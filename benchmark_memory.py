@@ -0,0 +1,100 @@
+"""Compare memory and serialization cost of the legacy dict layout and the slotted session models
+
+Usage: python benchmark_memory.py [--events 20000] [--channels 10]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from bot import GameSession, GameState, StoryEvent
+
+def make_texts(events):
+    """Create the event strings up front so both layouts share them"""
+    return [
+        (f"Player action number {i} in the story", f"Player{i % 6}", f"Outcome of action {i} as narrated by the game master")
+        for i in range(events)
+    ]
+
+def build_legacy(texts, channels):
+    """Build the old parallel-dict layout with one dict per event"""
+    per_channel = len(texts) // channels
+    data = {
+        'active_games': {}, 'game_states': {}, 'game_players': {},
+        'story_history': {}, 'game_languages': {}, 'characters': {}
+    }
+    for c in range(channels):
+        channel_id = str(c)
+        data['active_games'][channel_id] = True
+        data['game_states'][channel_id] = {
+            'current_scene': "scene", 'progress': 0, 'completed_objectives': [],
+            'main_objective': "objective", 'key_requirements': ["a", "b", "c"]
+        }
+        data['game_players'][channel_id] = [1, 2, 3]
+        data['game_languages'][channel_id] = 'both'
+        data['story_history'][channel_id] = [
+            {'action': action, 'actor': actor, 'result': result}
+            for action, actor, result in texts[c * per_channel:(c + 1) * per_channel]
+        ]
+    return data
+
+def build_sessions(texts, channels):
+    """Build the session layout with slotted events"""
+    per_channel = len(texts) // channels
+    return {
+        str(c): GameSession(
+            [1, 2, 3],
+            'both',
+            GameState("scene", "objective", ["a", "b", "c"]),
+            [StoryEvent(*event) for event in texts[c * per_channel:(c + 1) * per_channel]]
+        )
+        for c in range(channels)
+    }
+
+def measure(build, *args):
+    """Return (result, bytes allocated while building)"""
+    tracemalloc.start()
+    result = build(*args)
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, allocated
+
+def time_call(func, repeat=3):
+    """Return the best wall time of several runs in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=20000, help="Total story events")
+    parser.add_argument('--channels', type=int, default=10, help="Channels to spread the events over")
+    args = parser.parse_args()
+
+    texts = make_texts(args.events)
+
+    legacy, legacy_bytes = measure(build_legacy, texts, args.channels)
+    sessions, session_bytes = measure(build_sessions, texts, args.channels)
+
+    legacy_json = json.dumps(legacy)
+    session_json = json.dumps({cid: s.to_dict() for cid, s in sessions.items()})
+
+    rows = [
+        ("In-memory containers (bytes)", legacy_bytes, session_bytes),
+        ("Serialized size (bytes)", len(legacy_json), len(session_json)),
+        ("Serialize (ms)", time_call(lambda: json.dumps(legacy)),
+         time_call(lambda: json.dumps({cid: s.to_dict() for cid, s in sessions.items()}))),
+        ("Deserialize (ms)", time_call(lambda: json.loads(legacy_json)),
+         time_call(lambda: {cid: GameSession.from_dict(s) for cid, s in json.loads(session_json).items()}))
+    ]
+
+    print(f"{args.events} events across {args.channels} channels (event strings shared by both layouts)\n")
+    print(f"{'':32}{'legacy dicts':>16}{'sessions':>16}{'ratio':>10}")
+    for name, old, new in rows:
+        print(f"{name:32}{old:>16,.0f}{new:>16,.0f}{new / old:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,61 @@
+import time
+STARTUP_BEGAN = time.perf_counter()  # Taken before the other imports so they are profiled too
+
 import os
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 import json
 from pathlib import Path
-from openai import OpenAI
 import asyncio
 import random
 import unicodedata
-
-# Load environment variables
-load_dotenv()
-TOKEN = os.getenv('DISCORD_TOKEN')
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+import functools
+import re
+import contextvars
+import string
+import zlib
+import io
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 # OpenAI setup
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = None  # Created on first use so importing this module needs no credentials
+
+def get_client():
+    """Return the OpenAI client, creating it on first use"""
+    global client
+    if client is None:
+        started = time.perf_counter()
+        from openai import OpenAI
+        client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        record_startup("create OpenAI client", time.perf_counter() - started)
+    return client
+
+numpy_module = None  # Imported on first use; only story retrieval needs it
+
+def get_numpy():
+    """Return numpy, importing it on first use"""
+    global numpy_module
+    if numpy_module is None:
+        started = time.perf_counter()
+        import numpy
+        numpy_module = numpy
+        record_startup("import numpy", time.perf_counter() - started)
+    return numpy_module
+
+# Startup profiling
+startup_profile = []  # (step, seconds) in the order they ran
+
+def record_startup(step, seconds):
+    """Record how long a startup step took"""
+    startup_profile.append((step, seconds))
+
+def startup_report():
+    """Format the startup profile as a table"""
+    lines = ["Startup profile:"]
+    lines += [f"  {step:<28}{seconds * 1000:>9.1f} ms" for step, seconds in startup_profile]
+    return "\n".join(lines)
 
 # Bot setup
 intents = discord.Intents.default()
@@ -23,49 +63,239 @@ intents.message_content = True
 intents.members = True
 bot = commands.Bot(command_prefix='!', intents=intents)
 
+# Game data models
+class StoryEvent:
+    """A player action and its outcome"""
+    __slots__ = ('action', 'actor', 'result')
+
+    def __init__(self, action, actor, result):
+        self.action = action
+        self.actor = actor
+        self.result = result
+
+    def to_list(self):
+        """Serialize as a compact [action, actor, result] list"""
+        return [self.action, self.actor, self.result]
+
+class GameState:
+    """Current scene and objective progress of a game"""
+    __slots__ = ('current_scene', 'main_objective', 'key_requirements', 'completed_objectives', 'progress')
+
+    def __init__(self, current_scene, main_objective, key_requirements, completed_objectives=None, progress=0):
+        self.current_scene = current_scene
+        self.main_objective = main_objective
+        self.key_requirements = key_requirements
+        self.completed_objectives = completed_objectives if completed_objectives is not None else []
+        self.progress = progress
+
+    def to_dict(self):
+        """Serialize to a plain dict"""
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build from a serialized dict"""
+        return cls(**{slot: data[slot] for slot in cls.__slots__ if slot in data})
+
+class GameSession:
+    """Players, language, state, story and roles of a live game in one channel"""
+    __slots__ = ('players', 'language', 'state', 'story', 'characters', 'active')
+
+    def __init__(self, players, language, state, story=None, characters=None, active=True):
+        self.players = players
+        self.language = language
+        self.state = state
+        self.story = story if story is not None else []
+        self.characters = characters if characters is not None else {}
+        self.active = active   # False while the game is being closed
+
+    def to_dict(self):
+        """Serialize to the storage format, with events as compact lists"""
+        return {
+            'players': self.players,
+            'language': self.language,
+            'state': self.state.to_dict(),
+            'story': [event.to_list() for event in self.story],
+            'characters': self.characters,
+            'active': self.active
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build from the storage format"""
+        return cls(
+            data['players'],
+            data['language'],
+            GameState.from_dict(data['state']),
+            [StoryEvent(*event) for event in data['story']],
+            data.get('characters', {}),
+            data.get('active', True)
+        )
+
 # Data storage
 class GameData:
     """Manage persistent game data and storage"""
     def __init__(self):
-        self.characters = {}          # Store character data
-        self.active_games = {}        # Track active game sessions
-        self.game_states = {}         # Store current game states
-        self.game_players = {}        # Track players in each game
-        self.game_objectives = {}     # Track game objectives
         self.data_file = Path("game_data.json")
-        self.story_messages = {}      # Track story message IDs for each channel
-        self.story_history = {}       # Track story progression
-        self.game_languages = {}      # Store language settings for each game
-        self.load_data()
+        self.sessions = {}            # Live game session for each channel
+        self.setup_sessions = {}      # Setup checkpoints for channels still being initialized
+        self.finished = {}            # Stories of ended games waiting to be archived
 
     def load_data(self):
         """Load game data from file"""
         if self.data_file.exists():
             with open(self.data_file, 'r') as f:
                 data = json.load(f)
-                self.characters = data.get('characters', {})
-                self.active_games = data.get('active_games', {})
-                self.game_states = data.get('game_states', {})
-                self.game_players = data.get('game_players', {})
-                self.game_objectives = data.get('game_objectives', {})
-                self.story_history = data.get('story_history', {})
-                self.game_languages = data.get('game_languages', {})
+                self.setup_sessions = data.get('setup_sessions', {})
+                if 'sessions' in data:
+                    self.sessions = {cid: GameSession.from_dict(s) for cid, s in data['sessions'].items()}
+                else:
+                    self.migrate_legacy(data)
+
+            # Sessions interrupted while closing are treated as finished
+            for channel_id in [cid for cid, s in self.sessions.items() if not s.active]:
+                session = self.sessions.pop(channel_id)
+                self.finished[channel_id] = (session.story, session.language)
+
+    def migrate_legacy(self, data):
+        """Convert the old parallel-dict layout into sessions"""
+        story_history = data.get('story_history', {})
+        game_languages = data.get('game_languages', {})
+        for channel_id in data.get('active_games', {}):
+            if channel_id not in data.get('game_states', {}) or channel_id not in data.get('game_players', {}):
+                print(f"Dropping incomplete game session for channel {channel_id}")
+                continue
+            self.sessions[channel_id] = GameSession(
+                data['game_players'][channel_id],
+                game_languages.get(channel_id, 'both'),
+                GameState.from_dict(data['game_states'][channel_id]),
+                [StoryEvent(e['action'], e['actor'], e['result']) for e in story_history.get(channel_id, [])],
+                data.get('characters', {}).get(channel_id, {})
+            )
+
+        for channel_id, events in story_history.items():
+            if channel_id not in self.sessions and channel_id not in self.setup_sessions:
+                self.finished[channel_id] = (
+                    [StoryEvent(e['action'], e['actor'], e['result']) for e in events],
+                    game_languages.get(channel_id, 'both')
+                )
+
+    def get_session(self, channel_id):
+        """Return the channel's live game session, or None"""
+        session = self.sessions.get(channel_id)
+        return session if session is not None and session.active else None
+
+    def get_language(self, channel_id):
+        """Return the language of a channel's game or game setup"""
+        if channel_id in self.sessions:
+            return self.sessions[channel_id].language
+        return self.setup_sessions.get(channel_id, {}).get('language', 'both')
 
     def save_data(self):
         """Save game data to file"""
-        with open(self.data_file, 'w') as f:
+        # Write to a temporary file first so a crash never leaves a truncated data file
+        temp_file = self.data_file.with_suffix('.tmp')
+        with open(temp_file, 'w') as f:
             json.dump({
-                'characters': self.characters,
-                'active_games': self.active_games,
-                'game_states': self.game_states,
-                'game_players': self.game_players,
-                'game_objectives': self.game_objectives,
-                'story_history': self.story_history,
-                'game_languages': self.game_languages
-            }, f, indent=4)
+                'sessions': {cid: session.to_dict() for cid, session in self.sessions.items()},
+                'setup_sessions': self.setup_sessions
+            }, f)
+        os.replace(temp_file, self.data_file)
 
 game_data = GameData()
 
+class GameArchive:
+    """Append-only compressed archive of finished games with a per-game offset index"""
+    def __init__(self, archive_file, index_file):
+        self.archive_file = archive_file
+        self.index_file = index_file
+        self.index = []               # One entry per archived game, in archive order
+
+    def load_index(self):
+        """Load the offset index from disk"""
+        if self.index_file.exists():
+            damaged = False
+            with open(self.index_file, 'r') as f:
+                for line in f:
+                    try:
+                        self.index.append(json.loads(line))
+                    except ValueError:
+                        # Only a line torn by a crash mid-append can fail to parse
+                        print(f"Skipping damaged archive index line: {line[:80]!r}")
+                        damaged = True
+            if damaged:
+                # Rewrite so the next append does not continue the torn line
+                temp_file = self.index_file.with_suffix('.tmp')
+                with open(temp_file, 'w') as f:
+                    f.writelines(json.dumps(entry) + "\n" for entry in self.index)
+                os.replace(temp_file, self.index_file)
+
+    def append(self, channel_id, events, language):
+        """Compress a finished game's story into column form and append it"""
+        actors = list(dict.fromkeys(event.actor for event in events))
+        actor_ids = {actor: i for i, actor in enumerate(actors)}
+        record = {
+            'actors': actors,
+            'actor': [actor_ids[event.actor] for event in events],
+            'action': [event.action for event in events],
+            'result': [event.result for event in events]
+        }
+        payload = zlib.compress(json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+        with open(self.archive_file, 'ab') as f:
+            offset = f.tell()
+            f.write(payload)
+
+        entry = {
+            'channel_id': channel_id,
+            'language': language,
+            'ended_at': int(time.time()),
+            'events': len(events),
+            'offset': offset,
+            'length': len(payload)
+        }
+        with open(self.index_file, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+        self.index.append(entry)
+        return len(self.index) - 1
+
+    def iter_games(self, channel_id=None):
+        """Yield (archive_id, index entry) for archived games, optionally for one channel"""
+        for archive_id, entry in enumerate(self.index):
+            if channel_id is None or entry['channel_id'] == channel_id:
+                yield archive_id, entry
+
+    def iter_events(self, archive_id):
+        """Yield the story events of one archived game, reading only its own block"""
+        entry = self.index[archive_id]
+        with open(self.archive_file, 'rb') as f:
+            f.seek(entry['offset'])
+            record = json.loads(zlib.decompress(f.read(entry['length'])).decode('utf-8'))
+
+        actors = record['actors']
+        for actor_id, action, result in zip(record['actor'], record['action'], record['result']):
+            yield StoryEvent(action, actors[actor_id], result)
+
+game_archive = GameArchive(Path("game_archive.bin"), Path("game_archive_index.jsonl"))
+
+def close_game(channel_id):
+    """Remove a finished game from live data and move its story into the archive"""
+    story_indexes.pop(channel_id, None)
+    session = game_data.sessions.pop(channel_id, None)
+    if session and session.story:
+        game_archive.append(channel_id, session.story, session.language)
+    game_data.save_data()
+
+def archive_finished_games():
+    """Archive stories left in the data file by games that already ended"""
+    finished = list(game_data.finished.items())
+    game_data.finished.clear()
+    for channel_id, (events, language) in finished:
+        if events:
+            game_archive.append(channel_id, events, language)
+    if finished:
+        game_data.save_data()
+
 # Update remaining Chinese comments and section headers to English
 # Game type constants
 GAME_TYPES = {
@@ -140,9 +370,39 @@ SYSTEM_MESSAGES = {
     "how_to_play": "How to Play",
     "game_complete": "Adventure Successfully Completed!",
     "objectives_met": "All objectives have been met! The game has ended.",
-    "dm_error": "Couldn't send DM to {player_name}. Please enable DMs from server members."
+    "dm_error": "Couldn't send DM to {player_name}. Please enable DMs from server members.",
+    "translation_unavailable": "Translation unavailable / 暫時無法提供翻譯",
+    "no_votes": "No votes received. Randomly selected: {emoji} {game_type}",
+    "vote_tie": "Tie detected! Randomly selected from highest votes: {emoji} {game_type}",
+    "game_type_selected": "Selected game type: {emoji} {game_type}",
+    "join_button_prompt": "Press Join to join the game! (Waiting for 2+ players)",
+    "join_closed": "You have already joined, or joining is closed.",
+    "roles_ready": "Character roles are ready! Press the button to see yours privately.",
+    "no_role": "You don't have a role in this channel's game.",
+    "not_a_player": "Only players who joined this game can take actions.",
+    "turn_failed": "The game master couldn't resolve that action. Nothing changed; please try again.",
+    "setup_paused": "Game setup paused after repeated errors. Use !start_game to continue where it stopped.",
+    "no_archived_games": "No finished games have been archived in this channel."
+}
+
+# LLM work priority classes (lower value is served first)
+LLM_PRIORITIES = {
+    "turn": 0,            # Interactive turn adjudication
+    "setup": 1,           # Scenario, objective and role generation
+    "translation": 2,     # Translating output and player input
+    "background": 3       # Summaries and conclusions
+}
+
+# Maximum concurrent LLM calls per priority class
+LLM_CLASS_LIMITS = {
+    "turn": 4,
+    "setup": 2,
+    "translation": 3,
+    "background": 1
 }
 
+LLM_MAX_CONCURRENCY = 6  # Maximum concurrent LLM calls overall
+
 # Game guide message
 GAME_GUIDE = """
 Simply type your character's actions and dialogue directly in the channel!
@@ -152,10 +412,183 @@ Available commands:
 !scene - Review the current scene and objectives
 !story - View story history
 !end_game - End the game session
+
+Slash commands /act, /scene, /story, /role and /end_game work too.
 """
 
+# Language selection prompt
+LANGUAGE_PROMPT = """Choose your preferred language:
+
+🇺🇸 - English only
+🇹🇼 - Traditional Chinese only
+🌐 - Bilingual (English + Traditional Chinese)
+
+React to select! (10 seconds)"""
+
+# Traditional Chinese for static UI text, keyed by the English text
+UI_TRANSLATIONS_ZH = {
+    SYSTEM_MESSAGES["game_in_progress"]: "遊戲正在進行中！請使用 !end_game 結束目前的遊戲。",
+    SYSTEM_MESSAGES["not_enough_players"]: "玩家人數不足，已取消遊戲初始化。",
+    SYSTEM_MESSAGES["player_joined"]: "{player_name} 已加入遊戲！",
+    SYSTEM_MESSAGES["no_active_game"]: "此頻道沒有進行中的遊戲！",
+    SYSTEM_MESSAGES["no_story_history"]: "沒有可用的故事紀錄。",
+    SYSTEM_MESSAGES["game_ended"]: "遊戲已結束",
+    SYSTEM_MESSAGES["language_selection"]: "選擇遊戲語言",
+    SYSTEM_MESSAGES["no_language_selected"]: "未選擇語言，預設為雙語模式。",
+    SYSTEM_MESSAGES["language_selected"]: "已選擇語言：{language}",
+    SYSTEM_MESSAGES["new_game_init"]: "新遊戲初始化",
+    SYSTEM_MESSAGES["join_prompt"]: "按 👍 加入遊戲！（等待 2 名以上玩家）",
+    SYSTEM_MESSAGES["game_type_selection"]: "選擇遊戲類型",
+    SYSTEM_MESSAGES["vote_prompt"]: "按表情符號投票！（10 秒）",
+    SYSTEM_MESSAGES["game_type_descriptions"]: "遊戲類型說明",
+    SYSTEM_MESSAGES["how_to_play"]: "遊戲玩法",
+    SYSTEM_MESSAGES["game_complete"]: "冒險圓滿完成！",
+    SYSTEM_MESSAGES["objectives_met"]: "所有目標均已達成！遊戲結束。",
+    SYSTEM_MESSAGES["dm_error"]: "無法傳送私訊給 {player_name}。請開啟來自伺服器成員的私訊。",
+    SYSTEM_MESSAGES["no_votes"]: "未收到投票。隨機選擇：{emoji} {game_type}",
+    SYSTEM_MESSAGES["vote_tie"]: "票數相同！從最高票中隨機選擇：{emoji} {game_type}",
+    SYSTEM_MESSAGES["game_type_selected"]: "已選擇遊戲類型：{emoji} {game_type}",
+    SYSTEM_MESSAGES["join_button_prompt"]: "按「Join」加入遊戲！（等待 2 名以上玩家）",
+    SYSTEM_MESSAGES["join_closed"]: "你已經加入，或加入時間已結束。",
+    SYSTEM_MESSAGES["roles_ready"]: "角色已準備好！按下按鈕即可私下查看你的角色。",
+    SYSTEM_MESSAGES["no_role"]: "你在此頻道的遊戲中沒有角色。",
+    SYSTEM_MESSAGES["not_a_player"]: "只有已加入遊戲的玩家才能行動。",
+    SYSTEM_MESSAGES["turn_failed"]: "遊戲主持人無法處理這個行動。遊戲沒有任何改變，請再試一次。",
+    SYSTEM_MESSAGES["setup_paused"]: "遊戲設定因多次錯誤而暫停。請使用 !start_game 從中斷處繼續。",
+    SYSTEM_MESSAGES["no_archived_games"]: "此頻道沒有已封存的遊戲。",
+    GAME_GUIDE: """
+直接在頻道中輸入你角色的行動與對話即可！
+角色扮演不需要使用任何指令。
+
+可用指令：
+!scene - 查看目前場景與目標
+!story - 查看故事紀錄
+!end_game - 結束遊戲
+
+也可以使用斜線指令 /act、/scene、/story、/role 和 /end_game。
+""",
+    LANGUAGE_PROMPT: """選擇你偏好的語言：
+
+🇺🇸 - 僅英文
+🇹🇼 - 僅繁體中文
+🌐 - 雙語（英文 + 繁體中文）
+
+按表情符號選擇！（10 秒）""",
+
+    # Language names
+    "English": "英文",
+    "Traditional Chinese": "繁體中文",
+    "Bilingual": "雙語",
+
+    # Message titles
+    "New Adventure Begins": "新冒險開始",
+    "Current Scene": "目前場景",
+    "Story Progress": "故事進展",
+    "Roleplay Response": "角色扮演回應",
+
+    # Game categories
+    "Mystery & Detective": "懸疑與推理",
+    "Adventure & Action": "冒險與動作",
+    "Fantasy & Supernatural": "奇幻與超自然",
+    "Special Themes": "特殊主題",
+
+    # Game type names
+    "Mystery": "懸疑",
+    "Murder": "謀殺",
+    "Horror": "恐怖",
+    "Fantasy": "奇幻",
+    "Detective": "偵探",
+    "Adventure": "冒險",
+    "Heist": "劫案",
+    "Survival": "生存",
+    "Conspiracy": "陰謀",
+    "Comedy": "喜劇",
+    "Espionage": "諜報",
+    "Supernatural": "超自然",
+    "Historical": "歷史",
+    "Sci_fi": "科幻",
+    "Psychological": "心理",
+    "Escape": "逃脫",
+
+    # Game type descriptions
+    GAME_TYPE_DESCRIPTIONS["mystery"]: "解開複雜的謎團，揭露隱藏的真相",
+    GAME_TYPE_DESCRIPTIONS["murder"]: "調查謀殺案並找出兇手",
+    GAME_TYPE_DESCRIPTIONS["detective"]: "運用推理與證據破解案件",
+    GAME_TYPE_DESCRIPTIONS["psychological"]: "探索心理張力與心智博弈",
+    GAME_TYPE_DESCRIPTIONS["conspiracy"]: "揭開並周旋於錯綜複雜的陰謀",
+    GAME_TYPE_DESCRIPTIONS["adventure"]: "踏上刺激的旅程並迎接挑戰",
+    GAME_TYPE_DESCRIPTIONS["heist"]: "策劃並執行精密的劫案",
+    GAME_TYPE_DESCRIPTIONS["survival"]: "在嚴酷環境或威脅中求生",
+    GAME_TYPE_DESCRIPTIONS["escape"]: "設法從受困的處境中逃脫",
+    GAME_TYPE_DESCRIPTIONS["fantasy"]: "體驗魔法與神話般的冒險",
+    GAME_TYPE_DESCRIPTIONS["supernatural"]: "應對超自然現象",
+    GAME_TYPE_DESCRIPTIONS["horror"]: "面對恐怖的情境與生物",
+    GAME_TYPE_DESCRIPTIONS["sci_fi"]: "探索未來與科技的情境",
+    GAME_TYPE_DESCRIPTIONS["historical"]: "在歷史背景中展開冒險",
+    GAME_TYPE_DESCRIPTIONS["espionage"]: "執行間諜任務與秘密行動",
+    GAME_TYPE_DESCRIPTIONS["comedy"]: "享受幽默的情境與互動"
+}
+
+def format_fields(text):
+    """Return the format placeholders used in a template"""
+    return sorted(field for _, field, _, _ in string.Formatter().parse(text) if field)
+
+class LocaleCatalog:
+    """English to Traditional Chinese catalog for static UI text, with runtime translations stored on disk"""
+    def __init__(self, builtin, catalog_file):
+        self.catalog_file = catalog_file
+        self.builtin = builtin
+        self.learned = {}             # Translations generated at runtime, the only entries saved
+        self.entries = dict(builtin)
+
+    def load(self):
+        """Merge runtime translations saved on disk; built-in entries always win"""
+        if not self.catalog_file.exists():
+            return
+        with open(self.catalog_file, 'r', encoding='utf-8') as f:
+            self.learned = json.load(f)
+        self.entries = {**self.learned, **self.builtin}
+
+    def lookup(self, text):
+        """Return the stored Chinese text, or None"""
+        return self.entries.get(text)
+
+    async def translate(self, text):
+        """Return the Chinese text, translating and storing it on first use"""
+        if text not in self.entries:
+            translated = await translate_text(text, to_lang='zh')
+            # Keep lazily generated templates only if their placeholders survived
+            if not is_translated(text, translated) or format_fields(translated) != format_fields(text):
+                return text
+            self.entries[text] = translated
+            self.learned[text] = translated
+            self.save()
+        return self.entries[text]
+
+    async def render(self, text, selected_lang, separator="\n\n", **fields):
+        """Render UI text for a channel language, formatting each half with localized fields"""
+        en_text = text.format(**fields) if fields else text
+        if selected_lang not in ['zh', 'both']:
+            return en_text
+
+        zh_template = await self.translate(text)
+        zh_fields = {key: self.lookup(value) or value for key, value in fields.items()}
+        zh_text = zh_template.format(**zh_fields) if fields else zh_template
+        if selected_lang == 'zh' or zh_text == en_text:
+            return zh_text
+        return f"{en_text}{separator}{zh_text}"
+
+    def save(self):
+        """Write the runtime translations to disk"""
+        temp_file = self.catalog_file.with_suffix('.tmp')
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.learned, f, ensure_ascii=False, indent=4)
+        os.replace(temp_file, self.catalog_file)
+
+locale_catalog = LocaleCatalog(UI_TRANSLATIONS_ZH, Path("locale_catalog.json"))
+
 # Translation helper functions
-async def translate_text(text, to_lang='zh'):
+async def translate_text(text, to_lang='zh', channel_id=None, route="translation"):
     """Translate text between English and Traditional Chinese"""
     if not text or not isinstance(text, str):
         return text
@@ -163,6 +596,10 @@ async def translate_text(text, to_lang='zh'):
     if to_lang not in ['zh', 'en']:
         return text
 
+    # Static UI text comes from the catalog without an LLM call
+    if to_lang == 'zh' and locale_catalog.lookup(text):
+        return locale_catalog.lookup(text)
+
     try:
         prompt = f"""Translate the following {'English' if to_lang == 'zh' else 'Traditional Chinese'} text to {'Traditional Chinese' if to_lang == 'zh' else 'English'}.
 Keep all formatting, emojis, and special characters unchanged.
@@ -171,7 +608,8 @@ Only translate the actual text content.
 Text to translate:
 {text}"""
         
-        response = await get_ai_response(prompt)
+        # Cap output near the input length so short strings do not reserve a large budget
+        response = await get_ai_response(prompt, route=route, channel_id=channel_id, max_tokens=len(text) + 100)
         return response if isinstance(response, str) else text
     except Exception as e:
         print(f"Translation error: {e}")
@@ -224,16 +662,36 @@ def detect_language(text):
     else:
         return 'mixed'
 
-async def process_user_input(text, selected_lang):
+async def process_user_input(text, selected_lang, channel_id=None):
     """Process user input based on selected language"""
     input_lang = detect_language(text)
     
     # If input is Chinese, translate to English
     if input_lang == 'zh' or input_lang == 'mixed':
-        return await translate_text(text, to_lang='en')
+        # This is the first step of a live turn, so it is scheduled as turn work
+        return await translate_text(text, to_lang='en', channel_id=channel_id, route="input_translation")
     return text
 
-async def format_output(text, selected_lang):
+MAX_LENGTH = 2000  # Discord's message length limit
+
+def split_paragraphs(content, max_length):
+    """Split text into parts that respect paragraph boundaries"""
+    parts = []
+    current_part = ""
+    paragraphs = content.split('\n\n')
+    
+    for paragraph in paragraphs:
+        if len(current_part) + len(paragraph) + 2 <= max_length:
+            current_part += (paragraph + '\n\n')
+        else:
+            if current_part:
+                parts.append(current_part.strip())
+            current_part = paragraph + '\n\n'
+    if current_part:
+        parts.append(current_part.strip())
+    return parts
+
+async def format_output(text, selected_lang, channel_id=None):
     """Format output based on selected language"""
     if not text or not isinstance(text, str):
         return text
@@ -241,43 +699,24 @@ async def format_output(text, selected_lang):
     if selected_lang not in ['en', 'zh', 'both']:
         return text
 
-    MAX_LENGTH = 2000  # Discord's message length limit
-
     if not text:
         return text
 
-    def split_text(content):
-        """Split text into parts that respect paragraph boundaries"""
-        parts = []
-        current_part = ""
-        paragraphs = content.split('\n\n')
-        
-        for paragraph in paragraphs:
-            if len(current_part) + len(paragraph) + 2 <= MAX_LENGTH:
-                current_part += (paragraph + '\n\n')
-            else:
-                if current_part:
-                    parts.append(current_part.strip())
-                current_part = paragraph + '\n\n'
-        if current_part:
-            parts.append(current_part.strip())
-        return parts
-
     if selected_lang == 'zh':
         # Translate to Chinese and split if needed
-        translated = await translate_text(text, to_lang='zh')
+        translated = await translate_text(text, to_lang='zh', channel_id=channel_id)
         if len(translated) > MAX_LENGTH:
-            return split_text(translated)
+            return split_paragraphs(translated, MAX_LENGTH)
         return translated
         
     elif selected_lang == 'both':
         # Handle both languages
-        zh_text = await translate_text(text, to_lang='zh')
+        zh_text = await translate_text(text, to_lang='zh', channel_id=channel_id)
         
         # Split both texts if either is too long
         if len(text) > MAX_LENGTH // 2 or len(zh_text) > MAX_LENGTH // 2:
-            en_parts = split_text(text)
-            zh_parts = split_text(zh_text)
+            en_parts = split_paragraphs(text, MAX_LENGTH)
+            zh_parts = split_paragraphs(zh_text, MAX_LENGTH)
             
             # Combine corresponding parts
             combined_parts = []
@@ -295,10 +734,133 @@ async def format_output(text, selected_lang):
     
     # For English, split if needed
     if len(text) > MAX_LENGTH:
-        return split_text(text)
+        return split_paragraphs(text, MAX_LENGTH)
     return text
 
+# Progressive bilingual rendering
+PROGRESSIVE_TRANSLATION = True  # In 'both' channels, post English first and edit in the Chinese half
+TRANSLATION_TIMEOUT = 30        # Seconds to wait for the Chinese half before keeping English only
+EMBED_TITLE_LIMIT = 256         # Discord's embed title length limit
+EMBED_DESCRIPTION_LIMIT = 4096  # Discord's embed description length limit
+EMBED_TOTAL_LIMIT = 6000        # Discord's limit on all embed text in one message
+pending_translations = set()    # Background tasks filling in translations
+
+def part_title(title, index, total):
+    """Build the title for one part of a multi-part message"""
+    label = f"Part {index + 1}/{total}"
+    return f"{title} ({label})"[:EMBED_TITLE_LIMIT] if title else label
+
+def is_translated(original, translated):
+    """Check that a translation call actually produced a translation"""
+    return isinstance(translated, str) and translated not in (original, AI_ERROR_RESPONSE)
+
+async def send_progressive(ctx, content, title=None, color=None, channel_id=None):
+    """Send English embeds immediately and fill in the Chinese half in the background"""
+    MAX_EMBEDS = 25   # Discord's embed limit per message
+
+    # Leave room in each embed for the translation to be appended
+    parts = split_paragraphs(content, MAX_LENGTH // 2)
+
+    # Batch by count and by size, keeping half of each message's budget for the translation
+    batches = [[]]
+    batch_size = 0
+    for i, part in enumerate(parts):
+        size = len(part) + len(part_title(title, i, len(parts)))
+        if batches[-1] and (len(batches[-1]) >= MAX_EMBEDS or batch_size + size > EMBED_TOTAL_LIMIT // 2):
+            batches.append([])
+            batch_size = 0
+        batches[-1].append(i)
+        batch_size += size
+
+    sent = []
+    for number, batch in enumerate(batches, 1):
+        if len(batches) > 1:
+            await ctx.send(f"Batch {number}/{len(batches)}")
+        embeds = [
+            discord.Embed(
+                title=part_title(title, i, len(parts)),
+                description=parts[i],
+                color=color or discord.Color.blue()
+            )
+            for i in batch
+        ]
+        message = await ctx.send(embeds=embeds)
+        sent.append((message, embeds))
+
+    task = asyncio.create_task(fill_translations(sent, parts, title, channel_id))
+    pending_translations.add(task)
+    task.add_done_callback(pending_translations.discard)
+
+async def fill_translations(sent, parts, title, channel_id):
+    """Translate sent parts concurrently and edit them into the original messages"""
+    jobs = [asyncio.create_task(translate_text(part, to_lang='zh', channel_id=channel_id)) for part in parts]
+    if title:
+        jobs.append(asyncio.create_task(translate_text(title, to_lang='zh', channel_id=channel_id)))
+
+    # Keep whatever finished in time and give up only on the rest
+    done, pending = await asyncio.wait(jobs, timeout=TRANSLATION_TIMEOUT)
+    if pending:
+        print(f"Translation timed out for channel {channel_id}: {len(pending)} of {len(jobs)} unfinished")
+        for job in pending:
+            job.cancel()
+    results = [
+        job.result() if job in done and not job.cancelled() and job.exception() is None else None
+        for job in jobs
+    ]
+
+    zh_title = results.pop() if title else None
+    if is_translated(title, zh_title):
+        title = f"{title} | {zh_title}"
+
+    footer = SYSTEM_MESSAGES["translation_unavailable"]
+    index = 0
+    for message, embeds in sent:
+        for position, embed in enumerate(embeds):
+            embed.title = part_title(title, index + position, len(parts))
+
+        for position, embed in enumerate(embeds):
+            zh_part = results[index]
+            combined = f"{parts[index]}\n\n{zh_part}"
+            # Leave room for footers on the embeds still to be filled
+            reserve = len(footer) * (len(embeds) - position - 1)
+            total = sum(len(e) for e in embeds) - len(embed.description) + len(combined) + reserve
+            if (is_translated(parts[index], zh_part)
+                    and len(combined) <= EMBED_DESCRIPTION_LIMIT
+                    and total <= EMBED_TOTAL_LIMIT):
+                embed.description = combined
+            else:
+                embed.set_footer(text=footer)
+            index += 1
+
+        try:
+            await message.edit(embeds=embeds)
+        except discord.HTTPException as e:
+            print(f"Error editing translated message: {e}")
+
 # Message handling functions
+def get_channel_language(ctx):
+    """Return (channel_id, language) for a channel, context or user"""
+    if isinstance(ctx, discord.TextChannel):
+        channel_id = str(ctx.id)
+    elif isinstance(ctx, discord.User) or isinstance(ctx, discord.Member):
+        return None, 'en'
+    else:
+        channel_id = str(ctx.channel.id)
+    return channel_id, game_data.get_language(channel_id)
+
+async def send_ui_message(ctx, text, title=None, color=None, view=None, **fields):
+    """Send static UI text rendered from the localization catalog"""
+    try:
+        channel_id, selected_lang = get_channel_language(ctx)
+        embed = discord.Embed(
+            title=(await locale_catalog.render(title, selected_lang, " | "))[:EMBED_TITLE_LIMIT] if title else None,
+            description=await locale_catalog.render(text, selected_lang, **fields),
+            color=color or discord.Color.blue()
+        )
+        await ctx.send(embed=embed, view=view)
+    except Exception as e:
+        print(f"Error in send_ui_message: {e}")
+
 async def send_message(ctx, content, title=None, color=None):
     """Send a message in the appropriate language format"""
     if not ctx:
@@ -313,18 +875,15 @@ async def send_message(ctx, content, title=None, color=None):
         MAX_EMBEDS = 25   # Discord's embed limit per message
         
         # Get channel ID and language setting
-        if isinstance(ctx, discord.TextChannel):
-            channel_id = str(ctx.id)
-        elif isinstance(ctx, discord.User) or isinstance(ctx, discord.Member):
-            channel_id = None
-        else:
-            channel_id = str(ctx.channel.id)
+        channel_id, selected_lang = get_channel_language(ctx)
         
-        selected_lang = game_data.game_languages.get(channel_id, 'both') if channel_id else 'en'
+        if selected_lang == 'both' and PROGRESSIVE_TRANSLATION and isinstance(content, str):
+            await send_progressive(ctx, content, title, color, channel_id)
+            return
         
         # Format content and title
-        formatted_content = await format_output(content, selected_lang)
-        formatted_title = await format_output(title, selected_lang) if title else None
+        formatted_content = await format_output(content, selected_lang, channel_id)
+        formatted_title = await format_output(title, selected_lang, channel_id) if title else None
         
         # Handle content as list or single string
         if isinstance(formatted_content, list):
@@ -379,33 +938,214 @@ async def send_message(ctx, content, title=None, color=None):
 async def on_ready():
     """Log when bot successfully connects to Discord"""
     print(f'{bot.user} has connected to Discord!')
+    if startup_ready is not None and not any(step == "connect to Discord" for step, _ in startup_profile):
+        record_startup("connect to Discord", time.perf_counter() - startup_ready)
+        print(startup_report())
+    archive_finished_games()
+    await resume_setup_sessions()
+
+# User and DM channel cache settings
+USER_CACHE_SIZE = 512        # Users kept when not in the gateway cache
+DM_CHANNEL_CACHE_SIZE = 256  # Opened DM channels kept
+DM_FORBIDDEN_TTL = 3600      # Seconds to skip DMs to users who block them
+
+class UserResolver:
+    """Resolve users and DM channels from caches before falling back to REST calls"""
+    def __init__(self):
+        self.users = OrderedDict()        # LRU of users fetched over REST
+        self.dm_channels = OrderedDict()  # LRU of opened DM channels
+        self.dm_forbidden = {}            # User ID -> time until which DMs are skipped
+
+    def _remember(self, cache, key, value, max_size):
+        """Insert into an LRU cache, evicting the oldest entry"""
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > max_size:
+            cache.popitem(last=False)
+
+    async def get_user(self, user_id):
+        """Return a user from the gateway cache, the local LRU, or a REST fetch"""
+        user = bot.get_user(user_id)
+        if user is not None:
+            return user
+        if user_id in self.users:
+            self.users.move_to_end(user_id)
+            return self.users[user_id]
+
+        user = await bot.fetch_user(user_id)
+        self._remember(self.users, user_id, user, USER_CACHE_SIZE)
+        return user
+
+    async def get_dm_channel(self, user):
+        """Return an open DM channel for a user, opening one only if needed"""
+        if user.id in self.dm_channels:
+            self.dm_channels.move_to_end(user.id)
+            return self.dm_channels[user.id]
+
+        channel = user.dm_channel or await user.create_dm()
+        self._remember(self.dm_channels, user.id, channel, DM_CHANNEL_CACHE_SIZE)
+        return channel
+
+    def is_dm_forbidden(self, user_id):
+        """Check whether DMs to a user recently failed"""
+        until = self.dm_forbidden.get(user_id)
+        if until is None:
+            return False
+        if until < time.time():
+            del self.dm_forbidden[user_id]
+            return False
+        return True
+
+    async def send_dm(self, user, **kwargs):
+        """Send a DM, returning False if the user does not accept DMs"""
+        if self.is_dm_forbidden(user.id):
+            return False
+        try:
+            channel = await self.get_dm_channel(user)
+            await channel.send(**kwargs)
+            return True
+        except discord.Forbidden:
+            self.dm_forbidden[user.id] = time.time() + DM_FORBIDDEN_TTL
+            return False
+
+    async def prefetch(self, user):
+        """Cache a joining player and open their DM channel ahead of role delivery"""
+        if bot.get_user(user.id) is None:
+            self._remember(self.users, user.id, user, USER_CACHE_SIZE)
+        try:
+            await self.get_dm_channel(user)
+        except discord.HTTPException as e:
+            print(f"Could not open DM channel for {user.name}: {e}")
+
+user_resolver = UserResolver()
+pending_prefetches = set()  # Background DM channel prefetch tasks
+
+# Setup phase durations in seconds (phases without an entry run immediately)
+SETUP_PHASE_DURATIONS = {
+    "joining": 10,
+    "voting": 10,
+    "language": 10
+}
+
+SETUP_MAX_RETRIES = 3   # Retries of a failed setup phase before setup is paused
+SETUP_RETRY_DELAY = 10  # Seconds before the first retry, growing with each failure
 
-# Update class comments and structure
 class GameSetupState:
-    """Manage game setup state and temporary data"""
+    """Track in-process setup tasks; setup checkpoints live in game_data.setup_sessions"""
     def __init__(self):
-        self.waiting_for_players = {}  # Track channels waiting for players
-        self.joined_players = {}       # Track joined players for each channel
-        self.game_type = {}           # Store selected game type for each channel
+        self.tasks = {}         # Running setup task for each channel
+        self.recovered = set()  # Channels whose setup was resumed after a restart
 
 setup_state = GameSetupState()
 
+def checkpoint_setup(channel_id, phase=None, **fields):
+    """Update a setup session checkpoint and persist it"""
+    session = game_data.setup_sessions[channel_id]
+    session.update(fields)
+    if phase:
+        session['phase'] = phase
+        session['deadline'] = time.time() + SETUP_PHASE_DURATIONS.get(phase, 0)
+    game_data.save_data()
+    return session
+
+# Setup embeds rendered once per language
+async def build_game_type_embed(selected_lang):
+    """Build the game type voting embed"""
+    async def render(text, separator=" "):
+        return await locale_catalog.render(text, selected_lang, separator)
+
+    title = await render(SYSTEM_MESSAGES["game_type_selection"], " | ")
+    game_types_str = f"**🎲 {title}**\n\n"
+    for category, types in GAME_CATEGORIES.items():
+        game_types_str += f"**{await render(category)}**\n"
+        for game_type in types:
+            info = GAME_TYPES[game_type]
+            game_types_str += f"{info['emoji']} {await render(game_type.capitalize())}\n"
+        game_types_str += "\n"
+
+    vote_prompt = await render(SYSTEM_MESSAGES["vote_prompt"], "\n")
+    embed = discord.Embed(
+        title=title,
+        description=f"{vote_prompt}\n\n{game_types_str}",
+        color=discord.Color.green()
+    )
+    
+    # Add game type descriptions, one field per category to stay within field limits
+    descriptions_title = await render(SYSTEM_MESSAGES["game_type_descriptions"], " | ")
+    for category, types in GAME_CATEGORIES.items():
+        descriptions = []
+        for t in types:
+            name = await render(t.capitalize())
+            description = await render(GAME_TYPE_DESCRIPTIONS[t], " / ")
+            descriptions.append(f"{GAME_TYPES[t]['emoji']} **{name}**: {description}")
+        embed.add_field(
+            name=f"{descriptions_title} - {await render(category)}",
+            value="\n".join(descriptions),
+            inline=False
+        )
+    return embed
+
+async def build_language_embed(selected_lang):
+    """Build the language selection embed"""
+    return discord.Embed(
+        title=await locale_catalog.render(SYSTEM_MESSAGES["language_selection"], selected_lang, " | "),
+        description=await locale_catalog.render(LANGUAGE_PROMPT, selected_lang),
+        color=discord.Color.blue()
+    )
+
+SETUP_EMBED_BUILDERS = {
+    "game_type": build_game_type_embed,
+    "language": build_language_embed
+}
+rendered_embeds = {}  # (embed name, language) -> embed dict
+
+async def get_setup_embed(name, selected_lang):
+    """Return a setup embed, building it only the first time per language"""
+    key = (name, selected_lang)
+    if key not in rendered_embeds:
+        embed = await SETUP_EMBED_BUILDERS[name](selected_lang)
+        rendered_embeds[key] = embed.to_dict()
+    return discord.Embed.from_dict(rendered_embeds[key])
+
 # 修改 start_game 命令
 @bot.command(name='start_game')
 async def start_game(ctx):
     """Start the game initialization process"""
     channel_id = str(ctx.channel.id)
     
-    if channel_id in game_data.active_games:
-        msg = SYSTEM_MESSAGES["game_in_progress"]
-        await send_message(ctx, msg)
+    # Setup paused after repeated errors continues from its last checkpoint
+    resuming = channel_id in game_data.setup_sessions and channel_id not in setup_state.tasks
+    if not resuming and (channel_id in game_data.sessions or channel_id in game_data.setup_sessions):
+        await send_ui_message(ctx, SYSTEM_MESSAGES["game_in_progress"])
+        return
+
+    if not await acquire_quota(ctx.message):
+        return
+
+    if resuming:
+        setup_state.tasks[channel_id] = asyncio.current_task()
+        await run_setup(ctx.channel, channel_id)
         return
 
-    setup_state.waiting_for_players[channel_id] = True
-    setup_state.joined_players[channel_id] = []
+    game_data.setup_sessions[channel_id] = {'phase': "joining", 'joined_players': []}
+    game_data.save_data()
     
+    if INTERACTIONS_MODE:
+        # Players join with the button, so there is no reaction message to track
+        await send_ui_message(
+            ctx,
+            SYSTEM_MESSAGES["join_button_prompt"],
+            title=SYSTEM_MESSAGES["new_game_init"],
+            color=discord.Color.blue(),
+            view=JoinView()
+        )
+        checkpoint_setup(channel_id, phase="joining")
+        setup_state.tasks[channel_id] = asyncio.current_task()
+        await run_setup(ctx.channel, channel_id)
+        return
+
     # Create join prompt message
-    await send_message(
+    await send_ui_message(
         ctx,
         SYSTEM_MESSAGES["join_prompt"],
         title=SYSTEM_MESSAGES["new_game_init"],
@@ -414,88 +1154,10 @@ async def start_game(ctx):
     
     message = await ctx.send("👍")
     await message.add_reaction('👍')
-    
-    # Wait for 10 seconds to collect players
-    await asyncio.sleep(10)
-    
-    if channel_id in setup_state.waiting_for_players:
-        player_count = len(setup_state.joined_players[channel_id])
-        if player_count < 2:
-            await send_message(ctx, SYSTEM_MESSAGES["not_enough_players"])
-            cleanup_setup_state(channel_id)
-            return
-        
-        # Create game type voting message
-        game_types_str = "**🎲 " + SYSTEM_MESSAGES["game_type_selection"] + "**\n\n"
-        
-        for category, types in GAME_CATEGORIES.items():
-            game_types_str += f"**{category}**\n"
-            for game_type in types:
-                info = GAME_TYPES[game_type]
-                game_types_str += f"{info['emoji']} {game_type.capitalize()}\n"
-            game_types_str += "\n"
-
-        embed = discord.Embed(
-            title=SYSTEM_MESSAGES["game_type_selection"],
-            description=f"{SYSTEM_MESSAGES['vote_prompt']}\n\n{game_types_str}",
-            color=discord.Color.green()
-        )
-        
-        # Add game type descriptions
-        selected_lang = game_data.game_languages.get(str(ctx.channel.id), 'both')
-        descriptions = "\n".join(
-            f"{GAME_TYPES[t]['emoji']} **{t.capitalize()}**: {GAME_TYPE_DESCRIPTIONS[t]}"
-            for t in GAME_TYPES
-        )
-        embed.add_field(
-            name=SYSTEM_MESSAGES["game_type_descriptions"],
-            value=descriptions,
-            inline=False
-        )
+    checkpoint_setup(channel_id, phase="joining", message_id=message.id)
 
-        vote_msg = await ctx.send(embed=embed)
-        
-        # Add reactions for voting
-        for game_type in GAME_TYPES.values():
-            await vote_msg.add_reaction(game_type['emoji'])
-        
-        # Wait for 10 seconds
-        await asyncio.sleep(10)
-        
-        # Process voting results
-        vote_msg = await ctx.channel.fetch_message(vote_msg.id)
-        vote_counts = {}
-        for game_type, info in GAME_TYPES.items():
-            for reaction in vote_msg.reactions:
-                if str(reaction.emoji) == info['emoji']:
-                    vote_counts[game_type] = reaction.count - 1
-
-        # Handle voting results
-        if not vote_counts:
-            winning_type = random.choice(list(GAME_TYPES.keys()))
-            await send_message(
-                ctx,
-                f"No votes received. Randomly selected: {GAME_TYPES[winning_type]['emoji']} {winning_type.capitalize()}"
-            )
-        else:
-            max_votes = max(vote_counts.values())
-            winners = [t for t, v in vote_counts.items() if v == max_votes]
-            
-            if len(winners) > 1:
-                winning_type = random.choice(winners)
-                await send_message(
-                    ctx,
-                    f"Tie detected! Randomly selected from highest votes: {GAME_TYPES[winning_type]['emoji']} {winning_type.capitalize()}"
-                )
-            else:
-                winning_type = winners[0]
-                await send_message(
-                    ctx,
-                    f"Selected game type: {GAME_TYPES[winning_type]['emoji']} {winning_type.capitalize()}"
-                )
-        
-        setup_state.game_type[channel_id] = winning_type
-        await start_game_session(ctx, channel_id)
+    setup_state.tasks[channel_id] = asyncio.current_task()
+    await run_setup(ctx.channel, channel_id)
 
 # 修改 on_reaction_add 事件
 @bot.event
@@ -503,25 +1165,40 @@ async def on_reaction_add(reaction, user):
     if user.bot:
         return
         
-    channel_id = str(reaction.message.channel.id)
-    if channel_id in setup_state.waiting_for_players and reaction.emoji == '👍':
-        if user.id not in setup_state.joined_players[channel_id]:
-            setup_state.joined_players[channel_id].append(user.id)
-            await send_message(
-                reaction.message.channel,  # Use the channel directly
-                SYSTEM_MESSAGES["player_joined"].format(player_name=user.name)
-            )
+    if reaction.emoji == '👍':
+        await add_joined_player(reaction.message.channel, user)
+
+async def add_joined_player(channel, user):
+    """Add a player to a channel's joining phase, returning False if they cannot join"""
+    session = game_data.setup_sessions.get(str(channel.id))
+    if not session or session['phase'] != "joining" or user.id in session['joined_players']:
+        return False
+
+    session['joined_players'].append(user.id)
+    game_data.save_data()
+    if not INTERACTIONS_MODE:
+        # Roles go out by DM, so open the DM channel while others are still joining
+        task = asyncio.create_task(user_resolver.prefetch(user))
+        pending_prefetches.add(task)
+        task.add_done_callback(pending_prefetches.discard)
+    await send_ui_message(
+        channel,  # Use the channel directly
+        SYSTEM_MESSAGES["player_joined"],
+        player_name=user.name
+    )
+    return True
 
 # Message splitting helper
 async def send_long_message(ctx, content, title=None, color=None):
     """Split and send long messages"""
     MAX_LENGTH = 1000
-    selected_lang = game_data.game_languages.get(str(ctx.channel.id), 'both')
+    channel_id = str(ctx.channel.id)
+    selected_lang = game_data.get_language(channel_id)
     
     # Translate content if needed
-    content = await format_output(content, selected_lang)
+    content = await format_output(content, selected_lang, channel_id)
     if title:
-        title = await format_output(title, selected_lang)
+        title = await format_output(title, selected_lang, channel_id)
     
     if len(content) <= MAX_LENGTH:
         await send_message(ctx, content, title, color)
@@ -546,58 +1223,194 @@ async def send_long_message(ctx, content, title=None, color=None):
         part_title = f"{title} (Part {i+1}/{len(parts)})" if title else f"Part {i+1}/{len(parts)}"
         await send_message(ctx, part, part_title, color)
 
-async def start_game_session(ctx, channel_id):
-    """Initialize and start a new game session"""
-    game_type = setup_state.game_type[channel_id]
-    
-    # Language selection
-    language_embed = discord.Embed(
-        title=SYSTEM_MESSAGES["language_selection"],
-        description="""Choose your preferred language:
+async def resume_setup_sessions():
+    """Reschedule setup sessions that were interrupted by a restart"""
+    for channel_id in list(game_data.setup_sessions):
+        if channel_id in setup_state.tasks:
+            continue
 
-🇺🇸 - English only
-🇹🇼 - Traditional Chinese only
-🌐 - Bilingual (English + Traditional Chinese)
+        channel = bot.get_channel(int(channel_id))
+        if channel is None:
+            try:
+                channel = await bot.fetch_channel(int(channel_id))
+            except discord.HTTPException as e:
+                print(f"Dropping setup for unreachable channel {channel_id}: {e}")
+                cleanup_setup_state(channel_id)
+                continue
+
+        print(f"Resuming setup for channel {channel_id} at phase {game_data.setup_sessions[channel_id]['phase']}")
+        setup_state.recovered.add(channel_id)
+        setup_state.tasks[channel_id] = asyncio.create_task(run_setup(channel, channel_id))
+
+async def channel_reachable(channel_id):
+    """Check whether a setup channel still exists and is visible to the bot"""
+    try:
+        await bot.fetch_channel(int(channel_id))
+    except (discord.NotFound, discord.Forbidden):
+        return False
+    except discord.HTTPException:
+        pass  # A transient error says nothing about the channel, so let setup retry
+    return True
+
+async def run_setup(channel, channel_id):
+    """Drive a setup session through its remaining phases"""
+    failures = 0
+    try:
+        while channel_id in game_data.setup_sessions:
+            session = game_data.setup_sessions[channel_id]
+            
+            # Wait out whatever remains of the phase timer
+            remaining = session.get('deadline', 0) - time.time()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+            
+            try:
+                await SETUP_PHASE_HANDLERS[session['phase']](channel, channel_id, session)
+                failures = 0
+            except Exception as e:
+                if isinstance(e, (discord.NotFound, discord.Forbidden)) and not await channel_reachable(channel_id):
+                    # The channel is gone or closed to the bot, so setup can never finish
+                    print(f"Dropping setup for unreachable channel {channel_id}: {e}")
+                    cleanup_setup_state(channel_id)
+                    continue
+                # Keep the checkpoint so completed LLM steps are not generated again
+                failures += 1
+                if failures > SETUP_MAX_RETRIES:
+                    print(f"Setup for channel {channel_id} paused at phase {session['phase']}: {e}")
+                    await send_ui_message(channel, SYSTEM_MESSAGES["setup_paused"])
+                    return
+                print(f"Error during setup for channel {channel_id}, retrying: {e}")
+                await asyncio.sleep(SETUP_RETRY_DELAY * failures)
+    finally:
+        setup_state.tasks.pop(channel_id, None)
+        setup_state.recovered.discard(channel_id)
+
+async def fetch_reactions(channel, message_id):
+    """Fetch the current reactions on a setup message"""
+    try:
+        message = await channel.fetch_message(message_id)
+        return message.reactions
+    except discord.HTTPException as e:
+        print(f"Could not fetch setup message {message_id}: {e}")
+        return []
+
+async def finish_joining(channel, channel_id, session):
+    """Close joining and open the game type vote"""
+    if channel_id in setup_state.recovered and session.get('message_id'):
+        # Reactions made while the bot was down never reached on_reaction_add
+        for reaction in await fetch_reactions(channel, session['message_id']):
+            if str(reaction.emoji) == '👍':
+                async for user in reaction.users():
+                    if not user.bot and user.id not in session['joined_players']:
+                        session['joined_players'].append(user.id)
+
+    player_count = len(session['joined_players'])
+    if player_count < 2:
+        await send_ui_message(channel, SYSTEM_MESSAGES["not_enough_players"])
+        cleanup_setup_state(channel_id)
+        return
+    
+    # Create game type voting message
+    selected_lang = game_data.get_language(channel_id)
+    embed = await get_setup_embed("game_type", selected_lang)
 
-React to select! (10 seconds)""",
-        color=discord.Color.blue()
-    )
-    lang_msg = await ctx.send(embed=language_embed)
+    vote_msg = await channel.send(embed=embed)
     
-    # Add language selection reactions
-    for emoji in LANGUAGE_OPTIONS.keys():
-        await lang_msg.add_reaction(emoji)
+    # Add reactions for voting
+    try:
+        for game_type in GAME_TYPES.values():
+            await vote_msg.add_reaction(game_type['emoji'])
+    except discord.NotFound:
+        # The vote message was deleted; the vote count finds no reactions and picks at random
+        print(f"Vote message in channel {channel_id} was deleted")
     
-    # Wait for 10 seconds
-    await asyncio.sleep(10)
+    checkpoint_setup(channel_id, phase="voting", message_id=vote_msg.id)
+
+async def finish_voting(channel, channel_id, session):
+    """Count game type votes and open language selection"""
+    vote_counts = {}
+    reactions = await fetch_reactions(channel, session['message_id'])
+    for game_type, info in GAME_TYPES.items():
+        for reaction in reactions:
+            if str(reaction.emoji) == info['emoji']:
+                vote_counts[game_type] = reaction.count - 1
+
+    # Handle voting results
+    if not vote_counts:
+        winning_type = random.choice(list(GAME_TYPES.keys()))
+        result_message = SYSTEM_MESSAGES["no_votes"]
+    else:
+        max_votes = max(vote_counts.values())
+        winners = [t for t, v in vote_counts.items() if v == max_votes]
+        
+        if len(winners) > 1:
+            winning_type = random.choice(winners)
+            result_message = SYSTEM_MESSAGES["vote_tie"]
+        else:
+            winning_type = winners[0]
+            result_message = SYSTEM_MESSAGES["game_type_selected"]
+    await send_ui_message(
+        channel,
+        result_message,
+        emoji=GAME_TYPES[winning_type]['emoji'],
+        game_type=winning_type.capitalize()
+    )
     
-    # Get updated message to count reactions
-    lang_msg = await ctx.channel.fetch_message(lang_msg.id)
+    # Language selection
+    selected_lang = game_data.get_language(channel_id)
+    language_embed = await get_setup_embed("language", selected_lang)
+    lang_msg = await channel.send(embed=language_embed)
     
+    # Add language selection reactions
+    try:
+        for emoji in LANGUAGE_OPTIONS.keys():
+            await lang_msg.add_reaction(emoji)
+    except discord.NotFound:
+        # The language message was deleted; the vote count falls back to bilingual
+        print(f"Language message in channel {channel_id} was deleted")
+
+    checkpoint_setup(channel_id, phase="language", game_type=winning_type, message_id=lang_msg.id)
+
+async def finish_language(channel, channel_id, session):
+    """Count language votes and store the selected language"""
     # Count language votes
     lang_votes = {}
+    reactions = await fetch_reactions(channel, session['message_id'])
     for emoji, lang_info in LANGUAGE_OPTIONS.items():
-        for reaction in lang_msg.reactions:
+        for reaction in reactions:
             if str(reaction.emoji) == emoji:
                 lang_votes[lang_info['code']] = reaction.count - 1
 
     # Select language based on votes
     if not lang_votes:
         selected_lang = 'both'  # Default to bilingual
-        await send_message(ctx, SYSTEM_MESSAGES["no_language_selected"])
+        await send_ui_message(channel, SYSTEM_MESSAGES["no_language_selected"])
     else:
         selected_lang = max(lang_votes.items(), key=lambda x: x[1])[0]
         lang_name = next(info['name'] for info in LANGUAGE_OPTIONS.values() if info['code'] == selected_lang)
-        await send_message(
-            ctx,
-            SYSTEM_MESSAGES["language_selected"].format(language=lang_name)
+        await send_ui_message(
+            channel,
+            SYSTEM_MESSAGES["language_selected"],
+            language=lang_name
         )
     
     # Store selected language
-    game_data.game_languages[channel_id] = selected_lang
+    checkpoint_setup(channel_id, phase="scenario", language=selected_lang)
+
+async def generate_setup_text(prompt, route, channel_id, json_mode=False):
+    """Run one setup LLM step, raising on failure so run_setup retries instead of checkpointing an error"""
+    response = await get_larp_response(prompt, route=route, channel_id=channel_id, json_mode=json_mode)
+    if response == AI_ERROR_RESPONSE:
+        raise RuntimeError(f"{route} generation failed")
+    return response
+
+async def generate_scenario(channel, channel_id, session):
+    """Generate the initial story and objectives, checkpointing each LLM step"""
+    game_type = session['game_type']
 
     # Generate initial story and objectives
-    story_prompt = f"""Create a {game_type} LARP game scenario with the following structure:
+    if 'initial_story' not in session:
+        story_prompt = f"""Create a {game_type} LARP game scenario with the following structure:
 
 [OBJECTIVE]
 Create a clear, specific main objective that players need to accomplish.
@@ -611,10 +1424,13 @@ Describe the immediate situation players find themselves in.
 
 Format the response with clear section headers."""
 
-    initial_story = await get_larp_response(story_prompt)
+        initial_story = await generate_setup_text(story_prompt, "scenario", channel_id)
+        checkpoint_setup(channel_id, initial_story=initial_story)
+    initial_story = session['initial_story']
     
     # Extract objectives and requirements
-    objective_prompt = f"""From the following story setup, extract:
+    if 'game_state' not in session:
+        objective_prompt = f"""From the following story setup, extract:
 1. The main objective
 2. The specific requirements to complete it
 
@@ -631,59 +1447,40 @@ Format as JSON:
     ]
 }}"""
 
-    objectives_response = await get_larp_response(objective_prompt)
-    try:
-        objective = {}
-        if isinstance(objectives_response, str):
-            if objectives_response.startswith("```json") and objectives_response.endswith("```"):
-                objectives = json.loads(objectives_response[8:-3].strip())  # Remove the markers and strip whitespace
-            else:
-                objectives = json.loads(objectives_response)
-        else:
-            raise ValueError("Invalid response format")
-
-        game_data.game_states[channel_id] = {
-            'current_scene': initial_story,
-            'progress': 0,
-            'completed_objectives': [],
-            'main_objective': objectives['main_objective'],
-            'key_requirements': objectives['key_requirements']
-        }
-    except (json.JSONDecodeError, ValueError) as e:
-        print(f"Error parsing objectives JSON: {str(e)}")
-        game_data.game_states[channel_id] = {
-            'current_scene': initial_story,
-            'progress': 0,
-            'completed_objectives': [],
-            'main_objective': "Error extracting objective",
-            'key_requirements': []
-        }
+        objectives_response = await generate_setup_text(objective_prompt, "objectives", channel_id, json_mode=True)
+        try:
+            objectives = parse_json_response(objectives_response)
+            if not isinstance(objectives['key_requirements'], list):
+                raise TypeError("key_requirements is not a list")
+            game_state = GameState(initial_story, objectives['main_objective'], objectives['key_requirements'])
+        except (KeyError, TypeError, ValueError) as e:
+            # Raise so run_setup retries; a placeholder objective would be saved for good
+            raise ValueError(f"Could not parse objectives JSON: {e}") from e
+        checkpoint_setup(channel_id, game_state=game_state.to_dict())
 
     # Send initial story
     await send_message(
-        ctx,
+        channel,
         initial_story,
         title="New Adventure Begins",
         color=discord.Color.gold()
     )
-
-    # Generate and send character roles
-    await generate_character_roles(ctx, channel_id, game_type)
-
-    # Initialize game state
-    game_data.story_history[channel_id] = []
-    game_data.active_games[channel_id] = True
-    game_data.game_players[channel_id] = setup_state.joined_players[channel_id]
-    game_data.save_data()
+    checkpoint_setup(channel_id, phase="roles", roles={}, roles_sent=[])
 
 # Character generation helper
-async def generate_character_roles(ctx, channel_id, game_type):
-    """Generate and send character roles to players"""
-    selected_lang = game_data.game_languages.get(channel_id, 'both')
+async def generate_character_roles(channel, channel_id, session):
+    """Generate and send character roles to players, then start the game"""
+    game_type = session['game_type']
+    selected_lang = game_data.get_language(channel_id)
     
-    for player_id in setup_state.joined_players[channel_id]:
-        user = await bot.fetch_user(player_id)
-        role_prompt = f"""Create a character role for a {game_type} story.
+    for player_id in session['joined_players']:
+        if player_id in session['roles_sent']:
+            continue
+
+        # Roles are keyed by string because the checkpoint goes through JSON
+        role_info = session['roles'].get(str(player_id))
+        if role_info is None:
+            role_prompt = f"""Create a character role for a {game_type} story.
 Include:
 - Character name and description
 - 2-3 unique abilities or skills
@@ -691,42 +1488,398 @@ Include:
 - Suggested roleplay style
 Format with clear sections."""
 
-        role_info = await get_larp_response(role_prompt)
+            role_info = await generate_setup_text(role_prompt, "roles", channel_id)
+            session['roles'][str(player_id)] = role_info
+            checkpoint_setup(channel_id)
+
+        # In interactions mode players open their role with the role button instead
+        if not INTERACTIONS_MODE:
+            try:
+                user = await user_resolver.get_user(player_id)
+            except discord.NotFound:
+                # The account was deleted; skip its DM rather than the whole setup
+                user = None
+            delivered = False
+            if user is not None and not user_resolver.is_dm_forbidden(player_id):
+                # Create and send embed directly
+                embed = discord.Embed(
+                    title="Your Character Role",
+                    description=await format_output(role_info, selected_lang, channel_id),
+                    color=discord.Color.blue()
+                )
+                delivered = await user_resolver.send_dm(user, embed=embed)
+            if not delivered:
+                await send_ui_message(
+                    channel,
+                    SYSTEM_MESSAGES["dm_error"],
+                    player_name=user.name if user else f"<@{player_id}>"
+                )
+        session['roles_sent'].append(player_id)
+        checkpoint_setup(channel_id)
+
+    # Initialize game state
+    game_data.sessions[channel_id] = GameSession(
+        session['joined_players'],
+        session['language'],
+        GameState.from_dict(session['game_state']),
+        characters=session['roles']
+    )
+    story_indexes.pop(channel_id, None)
+    cleanup_setup_state(channel_id)
+
+    if INTERACTIONS_MODE:
+        await send_ui_message(channel, SYSTEM_MESSAGES["roles_ready"], view=RoleView())
+
+    await send_ui_message(
+        channel,
+        GAME_GUIDE,
+        title=SYSTEM_MESSAGES["how_to_play"],
+        color=discord.Color.green()
+    )
+
+# Setup phase handlers, run in order once each phase's deadline has passed
+SETUP_PHASE_HANDLERS = {
+    "joining": finish_joining,
+    "voting": finish_voting,
+    "language": finish_language,
+    "scenario": generate_scenario,
+    "roles": generate_character_roles
+}
+
+AI_ERROR_RESPONSE = "Error: Unable to generate response. Please try again."
+
+# Token-bucket quotas per scope: capacity and refill per second for requests and LLM tokens
+QUOTA_LIMITS = {
+    "user": {
+        "requests": {"capacity": 10, "refill": 10 / 60},
+        "tokens": {"capacity": 20000, "refill": 20000 / 3600}
+    },
+    "channel": {
+        "requests": {"capacity": 30, "refill": 30 / 60},
+        "tokens": {"capacity": 60000, "refill": 60000 / 3600}
+    },
+    "guild": {
+        "requests": {"capacity": 100, "refill": 100 / 60},
+        "tokens": {"capacity": 200000, "refill": 200000 / 3600}
+    }
+}
+QUOTA_SAVE_INTERVAL = 60  # Minimum seconds between quota file writes
+
+# Quota buckets charged for LLM calls made by the current task
+quota_keys = contextvars.ContextVar('quota_keys', default=())
+
+class QuotaManager:
+    """Token-bucket limits on requests and LLM tokens per user, channel and guild"""
+    def __init__(self, limits, data_file):
+        self.limits = limits
+        self.data_file = data_file
+        self.buckets = {}             # "scope:id" -> {"requests": [level, updated_at], "tokens": [...]}
+        self.dirty = False
+        self.last_save = 0
+
+    def load(self):
+        """Load saved buckets from disk"""
+        if self.data_file.exists():
+            with open(self.data_file, 'r') as f:
+                self.buckets = json.load(f)
+
+    def _bucket(self, key, kind):
+        """Return a bucket refilled up to now"""
+        limit = self.limits[key.split(':', 1)[0]][kind]
+        now = time.time()
+        state = self.buckets.setdefault(key, {}).setdefault(kind, [limit['capacity'], now])
+        state[0] = min(limit['capacity'], state[0] + (now - state[1]) * limit['refill'])
+        state[1] = now
+        return state
+
+    def try_acquire(self, keys):
+        """Take one request from every bucket, or none if any bucket is exhausted"""
+        requests = [self._bucket(key, "requests") for key in keys]
+        tokens = [self._bucket(key, "tokens") for key in keys]
+        if any(state[0] < 1 for state in requests) or any(state[0] <= 0 for state in tokens):
+            return False
+
+        for state in requests:
+            state[0] -= 1
+        self._touch()
+        return True
+
+    def charge_tokens(self, keys, count):
+        """Deduct used LLM tokens; buckets may go negative until they refill"""
+        for key in keys:
+            self._bucket(key, "tokens")[0] -= count
+        self._touch()
+
+    def remaining(self, key):
+        """Return the remaining requests and tokens for a bucket key"""
+        return {kind: int(self._bucket(key, kind)[0]) for kind in ("requests", "tokens")}
+
+    def _touch(self):
+        """Mark counters changed and save them if the save interval has passed"""
+        self.dirty = True
+        if time.time() - self.last_save >= QUOTA_SAVE_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Save counters if they changed since the last save"""
+        if self.dirty:
+            self.save()
+
+    def save(self):
+        """Persist buckets, dropping ones that have refilled to capacity"""
+        for key in list(self.buckets):
+            scope = self.limits[key.split(':', 1)[0]]
+            if all(self._bucket(key, kind)[0] >= scope[kind]['capacity'] for kind in self.buckets[key]):
+                del self.buckets[key]
+
+        temp_file = self.data_file.with_suffix('.tmp')
+        with open(temp_file, 'w') as f:
+            json.dump(self.buckets, f)
+        os.replace(temp_file, self.data_file)
+        self.dirty = False
+        self.last_save = time.time()
+
+quota_manager = QuotaManager(QUOTA_LIMITS, Path("quota_data.json"))
+
+def get_quota_keys(message):
+    """Return the user, channel and guild bucket keys for a message"""
+    keys = [f"user:{message.author.id}", f"channel:{message.channel.id}"]
+    if message.guild:
+        keys.append(f"guild:{message.guild.id}")
+    return tuple(keys)
+
+async def acquire_quota(message):
+    """Take one request for a message's author, channel and guild before any LLM work"""
+    keys = get_quota_keys(message)
+    if not quota_manager.try_acquire(keys):
+        # React instead of replying so a throttled request costs no LLM calls
+        await message.add_reaction('⏳')
+        return False
+    quota_keys.set(keys)
+    return True
+
+async def flush_quotas_periodically():
+    """Save changed quota counters even when no new requests arrive"""
+    while True:
+        await asyncio.sleep(QUOTA_SAVE_INTERVAL)
+        quota_manager.flush()
+
+def charge_usage(response):
+    """Charge an LLM response's token usage to the current quota buckets"""
+    usage = getattr(response, 'usage', None)
+    keys = quota_keys.get()
+    if usage and keys:
+        quota_manager.charge_tokens(keys, usage.total_tokens)
+
+# LLM work scheduling
+class LLMScheduler:
+    """Run LLM calls by priority class with per-class limits and fairness across channels"""
+    def __init__(self, priorities, class_limits, max_concurrency):
+        self.priorities = priorities
+        self.class_limits = class_limits
+        self.running = {work_class: 0 for work_class in priorities}  # Running calls per class
+        self.queues = {work_class: {} for work_class in priorities}  # Per-class channel -> waiters
+        self.total_running = 0
+        self.executor = None
+        self.max_concurrency = max_concurrency
+
+    @property
+    def max_concurrency(self):
+        """Maximum concurrent LLM calls overall"""
+        return self._max_concurrency
+
+    @max_concurrency.setter
+    def max_concurrency(self, value):
+        # A dedicated pool sized to the limit, so the default executor's size never caps
+        # concurrency and blocking LLM calls never starve other users of that executor
+        old_executor = self.executor
+        self._max_concurrency = value
+        self.executor = ThreadPoolExecutor(max_workers=value, thread_name_prefix="llm")
+        if old_executor is not None:
+            old_executor.shutdown(wait=False)
+        self._dispatch()  # A higher limit can admit waiting calls at once
+
+    async def run(self, work_class, channel_id, func, **kwargs):
+        """Wait for a slot in the given class, then run a blocking call in the executor"""
+        if work_class not in self.priorities:
+            work_class = "background"
+
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        self.queues[work_class].setdefault(channel_id, deque()).append(ready)
+        self._dispatch()
+
         try:
-            # Create and send embed directly
-            embed = discord.Embed(
-                title="Your Character Role",
-                description=await format_output(role_info, selected_lang),
-                color=discord.Color.blue()
-            )
-            await user.send(embed=embed)
-        except discord.Forbidden:
-            await send_message(
-                ctx.channel,  # Use the channel from context
-                SYSTEM_MESSAGES["dm_error"].format(player_name=user.name)
-            )
+            await ready
+        except asyncio.CancelledError:
+            # Give the slot back if it was granted just before cancellation
+            if ready.done() and not ready.cancelled():
+                self._release(work_class)
+            raise
+
+        # A cancelled caller leaves the call running in its thread, so the slot is only
+        # released when the executor future itself finishes
+        future = loop.run_in_executor(self.executor, functools.partial(func, **kwargs))
+        future.add_done_callback(functools.partial(self._finish, work_class))
+        return await asyncio.shield(future)
+
+    def _finish(self, work_class, future):
+        """Release the slot of a finished call, retrieving any error nobody awaited"""
+        if not future.cancelled():
+            future.exception()
+        self._release(work_class)
+
+    def _release(self, work_class):
+        """Free a slot and hand it to the next waiter"""
+        self.running[work_class] -= 1
+        self.total_running -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Grant free slots, highest priority first, round-robin across channels"""
+        for work_class in sorted(self.priorities, key=self.priorities.get):
+            channels = self.queues[work_class]
+            while (channels
+                   and self.total_running < self.max_concurrency
+                   and self.running[work_class] < self.class_limits[work_class]):
+                # Take the oldest waiter of the first channel, then move that channel to the back
+                channel_id = next(iter(channels))
+                waiters = channels.pop(channel_id)
+                ready = waiters.popleft()
+                if waiters:
+                    channels[channel_id] = waiters
+                if ready.done():
+                    continue  # Waiter was cancelled
+                self.running[work_class] += 1
+                self.total_running += 1
+                ready.set_result(None)
+
+    def stats(self):
+        """Return running and queued call counts per class"""
+        return {
+            work_class: {
+                'running': self.running[work_class],
+                'queued': sum(len(waiters) for waiters in self.queues[work_class].values())
+            }
+            for work_class in self.priorities
+        }
+
+llm_scheduler = LLMScheduler(LLM_PRIORITIES, LLM_CLASS_LIMITS, LLM_MAX_CONCURRENCY)
+
+# LLM routing table: model and request settings for each call type
+LLM_ROUTES = {
+    "translation": {"work_class": "translation", "model": "gpt-4o-mini", "max_tokens": 2000, "temperature": 0.3, "timeout": 30},
+    "input_translation": {"work_class": "turn", "model": "gpt-4o-mini", "max_tokens": 2000, "temperature": 0.3, "timeout": 30},
+    "adjudication": {"work_class": "turn", "model": "gpt-3.5-turbo-1106", "max_tokens": 900, "temperature": 0.7, "timeout": 30},
+    "scenario": {"work_class": "setup", "model": "gpt-3.5-turbo-1106", "max_tokens": 600, "temperature": 0.8, "timeout": 60},
+    "objectives": {"work_class": "setup", "model": "gpt-3.5-turbo-1106", "max_tokens": 300, "temperature": 0.2, "timeout": 30},
+    "roles": {"work_class": "setup", "model": "gpt-3.5-turbo-1106", "max_tokens": 500, "temperature": 0.8, "timeout": 30},
+    "conclusion": {"work_class": "background", "model": "gpt-3.5-turbo-1106", "max_tokens": 600, "temperature": 0.7, "timeout": 60}
+}
+ROUTE_FIELDS = {"model": str, "max_tokens": int, "temperature": float, "timeout": float}
+ROUTES_FILE = Path("llm_routes.json")  # Runtime overrides of LLM_ROUTES
+
+# USD per 1K prompt and completion tokens, for cost reporting
+MODEL_PRICES = {
+    "gpt-3.5-turbo-1106": (0.001, 0.002),
+    "gpt-4o-mini": (0.00015, 0.0006)
+}
+
+def load_route_overrides():
+    """Apply saved route overrides on top of the defaults"""
+    if ROUTES_FILE.exists():
+        with open(ROUTES_FILE, 'r') as f:
+            for route, settings in json.load(f).items():
+                if route in LLM_ROUTES:
+                    LLM_ROUTES[route].update({k: v for k, v in settings.items() if k in ROUTE_FIELDS})
+
+def set_route_option(route, field, value):
+    """Change one route setting at runtime and persist it"""
+    if route not in LLM_ROUTES:
+        raise ValueError(f"Unknown route: {route}")
+    if field not in ROUTE_FIELDS:
+        raise ValueError(f"Unknown route field: {field}")
+    LLM_ROUTES[route][field] = ROUTE_FIELDS[field](value)
+
+    with open(ROUTES_FILE, 'w') as f:
+        json.dump({name: {k: v for k, v in settings.items() if k in ROUTE_FIELDS}
+                   for name, settings in LLM_ROUTES.items()}, f, indent=4)
+
+class RouteStats:
+    """Track call count, latency, token usage and estimated cost per route"""
+    def __init__(self):
+        self.stats = {}
+
+    def record(self, route, model, latency, usage=None, failed=False):
+        """Record one finished call"""
+        stats = self.stats.setdefault(route, {
+            'calls': 0, 'errors': 0, 'latency': 0.0,
+            'prompt_tokens': 0, 'completion_tokens': 0, 'cost': 0.0
+        })
+        stats['calls'] += 1
+        stats['latency'] += latency
+        if failed:
+            stats['errors'] += 1
+        if usage:
+            prompt_price, completion_price = MODEL_PRICES.get(model, (0, 0))
+            stats['prompt_tokens'] += usage.prompt_tokens
+            stats['completion_tokens'] += usage.completion_tokens
+            stats['cost'] += (usage.prompt_tokens * prompt_price + usage.completion_tokens * completion_price) / 1000
+
+    def summary(self, route):
+        """Return a one-line report for a route"""
+        stats = self.stats.get(route)
+        if not stats:
+            return "No calls yet"
+        return (f"{stats['calls']} calls, {stats['errors']} errors, "
+                f"avg {stats['latency'] / stats['calls']:.2f}s, "
+                f"{stats['prompt_tokens'] + stats['completion_tokens']} tokens, ${stats['cost']:.6f}")
+
+route_stats = RouteStats()
+
+async def call_llm(route, messages, channel_id=None, json_mode=False, max_tokens=None):
+    """Run a chat completion with the settings of the given route"""
+    settings = LLM_ROUTES[route]
+    options = {}
+    if json_mode:
+        options['response_format'] = {"type": "json_object"}
+
+    started = time.monotonic()
+    try:
+        response = await llm_scheduler.run(
+            settings['work_class'],
+            channel_id,
+            get_client().chat.completions.create,
+            model=settings['model'],
+            messages=messages,
+            max_tokens=min(max_tokens or settings['max_tokens'], settings['max_tokens']),
+            temperature=settings['temperature'],
+            timeout=settings['timeout'],
+            **options
+        )
+    except Exception:
+        route_stats.record(route, settings['model'], time.monotonic() - started, failed=True)
+        raise
+
+    route_stats.record(route, settings['model'], time.monotonic() - started, response.usage)
+    charge_usage(response)
+    return response.choices[0].message.content
 
 # AI response handler
-async def get_ai_response(prompt):
+async def get_ai_response(prompt, route="translation", channel_id=None, max_tokens=None):
     """Get response from OpenAI API"""
     try:
         messages = [
             {"role": "user", "content": prompt}
         ]
 
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo-1106",
-            messages=messages,
-            max_tokens=2000,
-            temperature=0.7
-        )
-        return response.choices[0].message.content
+        return await call_llm(route, messages, channel_id, max_tokens=max_tokens)
     except Exception as e:
         print(f"OpenAI API Error: {str(e)}")
-        return "Error: Unable to generate response. Please try again."
+        return AI_ERROR_RESPONSE
 
 # LARP AI response handler
-async def get_larp_response(prompt, game_state=None):
+async def get_larp_response(prompt, game_state=None, route="adjudication", channel_id=None, json_mode=False):
     """Get larp response from OpenAI API"""
     try:
         system_prompt = """You are an experienced LARP game master. 
@@ -745,41 +1898,217 @@ Use descriptive language and maintain consistent story elements."""
                 "content": f"Current game state: {game_state}"
             })
 
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo-1106",
-            messages=messages,
-            max_tokens=600,
-            temperature=0.7
-        )
-        return response.choices[0].message.content
+        return await call_llm(route, messages, channel_id, json_mode=json_mode)
     except Exception as e:
         print(f"OpenAI API Error: {str(e)}")
-        return "Error: Unable to generate response. Please try again."
+        return AI_ERROR_RESPONSE
+
+def parse_json_response(response):
+    """Parse a JSON response, tolerating markdown code fences"""
+    if not isinstance(response, str):
+        raise ValueError("Invalid response format")
+
+    text = response.strip()
+    if text.startswith("```"):
+        text = text.split('\n', 1)[1] if '\n' in text else ""
+        if text.endswith("```"):
+            text = text[:-3]
+    return json.loads(text.strip())
+
+# Story retrieval settings
+EMBEDDING_DIM = 1024        # Hashing vectorizer dimensions
+RETRIEVAL_TOP_K = 3         # Past events included in each turn prompt
+RETRIEVAL_MAX_CHARS = 300   # Characters kept from each retrieved event
+
+# Common words ignored when embedding
+STOPWORDS = {
+    "the", "and", "for", "with", "that", "this", "you", "your", "are", "was", "were",
+    "has", "have", "had", "from", "into", "onto", "but", "not", "she", "her", "his",
+    "him", "they", "them", "their", "what", "which", "who", "does", "did", "can"
+}
+
+def embed_text(text):
+    """Embed text as an L2-normalized signed hashing vector"""
+    np = get_numpy()
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    words = [w for w in re.findall(r"[a-z0-9']+", text.lower()) if len(w) > 2 and w not in STOPWORDS]
+    # Words, adjacent word pairs and individual Chinese characters
+    tokens = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    tokens += re.findall(r"[\u4e00-\u9fff]", text)
+
+    for token in tokens:
+        h = zlib.crc32(token.encode('utf-8'))
+        vector[h % EMBEDDING_DIM] += 1.0 if h & 0x80000000 else -1.0
+
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class StoryIndex:
+    """Vector index over a channel's role sheets and story events"""
+    def __init__(self):
+        np = get_numpy()
+        self.vectors = np.zeros((16, EMBEDDING_DIM), dtype=np.float32)
+        self.documents = []
+
+    def add(self, text):
+        """Embed and store a document, growing the matrix as needed"""
+        np = get_numpy()
+        if len(self.documents) == len(self.vectors):
+            self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+        self.vectors[len(self.documents)] = embed_text(text)
+        self.documents.append(text)
+
+    def search(self, query, k=RETRIEVAL_TOP_K, limit=None):
+        """Return up to k documents most similar to the query, among the first `limit`"""
+        count = len(self.documents) if limit is None else min(limit, len(self.documents))
+        if count <= 0 or k <= 0:
+            return []
+
+        np = get_numpy()
+        scores = self.vectors[:count] @ embed_text(query)
+        k = min(k, count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [self.documents[i] for i in top if scores[i] > 0]
+
+story_indexes = {}  # Story index for each channel, built on first use
+
+def format_event(event):
+    """Render a story event as a single retrievable document"""
+    return f"{event.actor}: {event.action} -> {event.result}"
+
+def get_story_index(channel_id):
+    """Return the channel's story index, building it from saved data if needed"""
+    if channel_id not in story_indexes:
+        index = StoryIndex()
+        session = game_data.sessions.get(channel_id)
+        if session:
+            for role_info in session.characters.values():
+                index.add(role_info)
+            for event in session.story:
+                index.add(format_event(event))
+        story_indexes[channel_id] = index
+    return story_indexes[channel_id]
+
+def retrieve_relevant_events(channel_id, query):
+    """Return truncated past events and role sheets relevant to the query"""
+    index = get_story_index(channel_id)
+    # The latest event is already the current scene, so leave it out
+    session = game_data.sessions.get(channel_id)
+    limit = len(index.documents) - 1 if session and session.story else None
+    return [
+        doc if len(doc) <= RETRIEVAL_MAX_CHARS else doc[:RETRIEVAL_MAX_CHARS] + "..."
+        for doc in index.search(query, limit=limit)
+    ]
+
+# Objective tracking helpers
+def get_unmet_requirements(game_state):
+    """Return the key requirements that have not been completed yet"""
+    return [req for req in game_state.key_requirements if req not in game_state.completed_objectives]
+
+def update_objective_progress(game_state, newly_met):
+    """Record newly met requirements and update the progress percentage"""
+    for requirement in newly_met:
+        if requirement not in game_state.completed_objectives:
+            game_state.completed_objectives.append(requirement)
+
+    total = len(game_state.key_requirements)
+    if total:
+        game_state.progress = int(100 * len(game_state.completed_objectives) / total)
+
+async def adjudicate_action(action_text, game_state, channel_id=None):
+    """
+    Evaluate a player action against the unmet requirements
+    Returns: dict with 'narrative', 'newly_met', 'game_complete' and 'failed'
+    """
+    unmet = get_unmet_requirements(game_state)
+    requirement_list = "\n".join(f"{i}. {req}" for i, req in enumerate(unmet, 1)) or "None"
+    relevant_events = retrieve_relevant_events(channel_id, action_text) if channel_id else []
+    event_list = "\n".join(f"- {event}" for event in relevant_events) or "None"
+
+    prompt = f"""Player action: {action_text}
+Current scene: {game_state.current_scene}
+
+Relevant earlier events and characters:
+{event_list}
+
+Main objective: {game_state.main_objective}
+Requirements not yet met:
+{requirement_list}
+
+Narrate the outcome of this action and strictly evaluate each listed requirement.
+Only mark a requirement as met if this action or earlier events fully satisfy it.
+
+Respond with JSON only:
+{{
+    "narrative": "description of what happens next",
+    "requirements": [
+        {{"id": 1, "met": false, "reason": "why it is or is not met"}}
+    ],
+    "game_complete": false
+}}"""
+
+    response = await get_larp_response(prompt, channel_id=channel_id, json_mode=True)
+    try:
+        result = parse_json_response(response)
+        narrative = str(result.get('narrative') or "").strip()
+
+        newly_met = []
+        for status in result.get('requirements') or []:
+            req_id = status.get('id')
+            if status.get('met') is True and isinstance(req_id, int) and 1 <= req_id <= len(unmet):
+                newly_met.append(unmet[req_id - 1])
+
+        # Completion is decided by tracked requirements when there are any
+        if game_state.key_requirements:
+            game_complete = len(newly_met) == len(unmet)
+        else:
+            game_complete = result.get('game_complete') is True
+
+        return {
+            'narrative': narrative or "The story continues...",
+            'newly_met': newly_met,
+            'game_complete': game_complete,
+            'failed': False
+        }
+    except (ValueError, AttributeError, TypeError) as e:
+        # API errors and unparseable replies must never become part of the story
+        print(f"Error parsing adjudication JSON: {str(e)}")
+        return {
+            'narrative': None,
+            'newly_met': [],
+            'game_complete': False,
+            'failed': True
+        }
 
 # Game state cleanup
 def cleanup_setup_state(channel_id):
     """Clean up setup state for a channel"""
-    if channel_id in setup_state.waiting_for_players:
-        del setup_state.waiting_for_players[channel_id]
-    if channel_id in setup_state.joined_players:
-        del setup_state.joined_players[channel_id]
-    if channel_id in setup_state.game_type:
-        del setup_state.game_type[channel_id]
+    game_data.setup_sessions.pop(channel_id, None)
+    game_data.save_data()
 
 @bot.command(name='end_game')
 async def end_game(ctx):
     """End the current game session"""
     channel_id = str(ctx.channel.id)
-    if channel_id not in game_data.active_games:
-        await send_message(ctx, SYSTEM_MESSAGES["no_active_game"])
+    session = game_data.get_session(channel_id)
+    if not session:
+        await send_ui_message(ctx, SYSTEM_MESSAGES["no_active_game"])
+        return
+
+    if not await acquire_quota(ctx.message):
         return
 
     prompt = "Create a satisfying conclusion for the current scene, wrapping up any immediate plot points."
-    conclusion = await get_larp_response(prompt, game_data.game_states[channel_id])
+    conclusion = await get_larp_response(
+        prompt,
+        session.state.to_dict(),
+        route="conclusion",
+        channel_id=channel_id
+    )
 
-    del game_data.active_games[channel_id]
-    del game_data.game_states[channel_id]
-    game_data.save_data()
+    # Stop accepting actions while the conclusion is sent
+    session.active = False
 
     await send_message(
         ctx,
@@ -787,19 +2116,105 @@ async def end_game(ctx):
         title=SYSTEM_MESSAGES["game_ended"],
         color=discord.Color.red()
     )
+    close_game(channel_id)
+
+@bot.command(name='quota')
+@commands.has_permissions(administrator=True)
+async def show_quota(ctx, member: discord.Member = None):
+    """Show remaining request and token budget for this guild, channel and a user"""
+    member = member or ctx.author
+    scopes = [("User", member.name, f"user:{member.id}"), ("Channel", ctx.channel.name, f"channel:{ctx.channel.id}")]
+    if ctx.guild:
+        scopes.append(("Guild", ctx.guild.name, f"guild:{ctx.guild.id}"))
+
+    embed = discord.Embed(title="Remaining Quota", color=discord.Color.blue())
+    for scope, name, key in scopes:
+        remaining = quota_manager.remaining(key)
+        limits = QUOTA_LIMITS[key.split(':', 1)[0]]
+        embed.add_field(
+            name=f"{scope}: {name}",
+            value=(f"Requests: {remaining['requests']}/{limits['requests']['capacity']}\n"
+                   f"Tokens: {remaining['tokens']}/{limits['tokens']['capacity']}"),
+            inline=False
+        )
+    # Sent directly so admin reports never trigger translation
+    await ctx.send(embed=embed)
+
+@bot.command(name='route')
+@commands.has_permissions(administrator=True)
+async def configure_route(ctx, route=None, field=None, value=None):
+    """Show LLM routes and their stats, or change one route setting"""
+    if route and field and value is not None:
+        try:
+            set_route_option(route, field, value)
+        except ValueError as e:
+            await ctx.send(f"Error: {e}")
+            return
+
+    embed = discord.Embed(title="LLM Routes", color=discord.Color.blue())
+    for name, settings in LLM_ROUTES.items():
+        embed.add_field(
+            name=name,
+            value=(f"{settings['model']}, max_tokens={settings['max_tokens']}, "
+                   f"temperature={settings['temperature']}, timeout={settings['timeout']}s\n"
+                   f"{route_stats.summary(name)}"),
+            inline=False
+        )
+    # Sent directly so admin reports never trigger translation
+    await ctx.send(embed=embed)
+
+@bot.command(name='archive')
+async def show_archive(ctx, number: int = None):
+    """List this channel's finished games, or export one as a text file"""
+    games = list(game_archive.iter_games(str(ctx.channel.id)))
+    if not games:
+        await send_ui_message(ctx, SYSTEM_MESSAGES["no_archived_games"])
+        return
+
+    if number is None:
+        embed = discord.Embed(title="Archived Games", color=discord.Color.blue())
+        # Embeds hold at most 25 fields, so list the most recent games
+        for n, (_, entry) in list(enumerate(games, 1))[-25:]:
+            ended = time.strftime('%Y-%m-%d %H:%M UTC', time.gmtime(entry['ended_at']))
+            embed.add_field(name=f"#{n}", value=f"{ended}, {entry['events']} events", inline=False)
+        embed.set_footer(text="Use !archive <number> to download a story")
+        await ctx.send(embed=embed)
+        return
+
+    if not 1 <= number <= len(games):
+        await ctx.send(f"Error: choose a game between 1 and {len(games)}")
+        return
+
+    lines = []
+    for event in game_archive.iter_events(games[number - 1][0]):
+        lines.append(f"{event.actor}: {event.action}\n-> {event.result}\n")
+    story = io.BytesIO("\n".join(lines).encode('utf-8'))
+    # Sent directly so exports are never translated
+    await ctx.send(file=discord.File(story, filename=f"game_{number}.txt"))
 
 @bot.command(name='scene')
 async def get_current_scene(ctx):
     """Display the current scene description"""
     channel_id = str(ctx.channel.id)
-    if channel_id not in game_data.active_games:
-        await send_message(ctx, SYSTEM_MESSAGES["no_active_game"])
+    session = game_data.get_session(channel_id)
+    if not session:
+        await send_ui_message(ctx, SYSTEM_MESSAGES["no_active_game"])
         return
 
-    current_state = game_data.game_states[channel_id]
+    # Bilingual and Chinese channels translate the scene
+    if not await acquire_quota(ctx.message):
+        return
+
+    current_state = session.state
+    scene_text = f"{current_state.current_scene}\n\n"
+    scene_text += f"**🎯 Objective ({current_state.progress}%)**: {current_state.main_objective}\n"
+    for requirement in current_state.key_requirements:
+        mark = "✅" if requirement in current_state.completed_objectives else "⬜"
+        scene_text += f"{mark} {requirement}\n"
+
     await send_message(
         ctx,
-        current_state['current_scene'],
+        scene_text,
         title="Current Scene",
         color=discord.Color.blue()
     )
@@ -808,47 +2223,52 @@ async def get_current_scene(ctx):
 async def show_story(ctx):
     """Display the full story history"""
     channel_id = str(ctx.channel.id)
-    if channel_id not in game_data.active_games:
-        await send_message(ctx, SYSTEM_MESSAGES["no_active_game"])
+    session = game_data.get_session(channel_id)
+    if not session:
+        await send_ui_message(ctx, SYSTEM_MESSAGES["no_active_game"])
         return
 
-    if channel_id not in game_data.story_history:
-        await send_message(ctx, SYSTEM_MESSAGES["no_story_history"])
+    if not session.story:
+        await send_ui_message(ctx, SYSTEM_MESSAGES["no_story_history"])
+        return
+
+    # Bilingual and Chinese channels translate the story
+    if not await acquire_quota(ctx.message):
         return
 
     story_text = "**📖 Story History**\n\n"
-    for event in game_data.story_history[channel_id]:
-        story_text += f"\n👤 **{event['actor']}**: {event['action']}\n"
-        story_text += f"➡️ {event['result']}\n"
+    for event in session.story:
+        story_text += f"\n👤 **{event.actor}**: {event.action}\n"
+        story_text += f"➡️ {event.result}\n"
 
     await send_long_message(ctx, story_text, color=discord.Color.blue())
 
 async def update_story_message(ctx, channel_id, new_content, action=None, actor=None):
     """Update the story message with new content"""
-    if channel_id not in game_data.story_history:
-        game_data.story_history[channel_id] = []
+    session = game_data.sessions.get(channel_id)
+    if not session:
+        return
 
     # Add new story event
     if action and actor:
-        game_data.story_history[channel_id].append({
-            'action': action,
-            'actor': actor,
-            'result': new_content
-        })
+        event = StoryEvent(action, actor, new_content)
+        session.story.append(event)
+        if channel_id in story_indexes:
+            story_indexes[channel_id].add(format_event(event))
 
     # Create story summary
     story_summary = "**🎭 Story Progress**\n\n"
     story_summary += "**Recent Events:**\n"
     
     # Add last event
-    for event in game_data.story_history[channel_id][-1:]:
-        story_summary += f"\n👤 **{event['actor']}**: {event['action']}\n"
-        story_summary += f"➡️ {event['result']}\n"
+    for event in session.story[-1:]:
+        story_summary += f"\n👤 **{event.actor}**: {event.action}\n"
+        story_summary += f"➡️ {event.result}\n"
     
     story_summary += "\n**Current Scene:**\n"
     # Check if current_scene is a string before concatenation
-    if isinstance(game_data.game_states[channel_id]['current_scene'], str):
-        story_summary += game_data.game_states[channel_id]['current_scene']
+    if isinstance(session.state.current_scene, str):
+        story_summary += session.state.current_scene
     else:
         story_summary += "Current scene data is not available."
 
@@ -859,6 +2279,57 @@ async def update_story_message(ctx, channel_id, new_content, action=None, actor=
         color=discord.Color.blue()
     )
 
+# Traffic recording for replay_traffic.py (opt-in)
+TRAFFIC_RECORDING = False                 # Record anonymized inbound messages
+TRAFFIC_LOG_FILE = Path("traffic_log.jsonl")
+TRAFFIC_FLUSH_EVENTS = 100                # Buffered events written per flush
+TRAFFIC_FLUSH_INTERVAL = 60               # Maximum seconds between flushes
+
+class TrafficRecorder:
+    """Append anonymized inbound message events to a compact JSON lines log"""
+    def __init__(self, log_file):
+        self.log_file = log_file
+        self.started = None   # Monotonic time of the first event in this recording
+        self.last_flush = 0
+        self.channels = {}    # Channel ID -> alias numbered from 0, never written out
+        self.users = {}       # User ID -> alias numbered from 0, never written out
+        self.lines = []       # Events not yet written
+
+    def record(self, message):
+        """Buffer one message as [seconds, channel, user, length, language, is_command]"""
+        now = time.monotonic()
+        if self.started is None:
+            self.started = self.last_flush = now
+            self.lines.append(json.dumps({"recording": int(time.time())}))
+
+        content = message.content or ""
+        event = [
+            round(now - self.started, 3),
+            self.channels.setdefault(message.channel.id, len(self.channels)),
+            self.users.setdefault(message.author.id, len(self.users)),
+            len(content),
+            detect_language(content),
+            int(content.startswith(bot.command_prefix))
+        ]
+        self.lines.append(json.dumps(event, separators=(',', ':')))
+
+        if len(self.lines) >= TRAFFIC_FLUSH_EVENTS or now - self.last_flush >= TRAFFIC_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Append buffered events to the log file"""
+        if not self.lines:
+            return
+        try:
+            with open(self.log_file, 'a', encoding='utf-8') as f:
+                f.write("\n".join(self.lines) + "\n")
+            self.lines = []
+        except OSError as e:
+            print(f"Error writing traffic log: {e}")
+        self.last_flush = time.monotonic()
+
+traffic_recorder = TrafficRecorder(TRAFFIC_LOG_FILE)
+
 # 添加新的事件監聽器來處理一般訊息
 @bot.event
 async def on_message(message):
@@ -866,16 +2337,21 @@ async def on_message(message):
     if message.author.bot:
         return
 
+    if TRAFFIC_RECORDING:
+        traffic_recorder.record(message)
+
     channel_id = str(message.channel.id)
     user_id = str(message.author.id)
 
     # Check if there's an active game in the channel
-    if channel_id in game_data.active_games:
+    session = game_data.get_session(channel_id)
+    if session:
         # Check if the speaker is a game participant
-        if user_id in [str(pid) for pid in game_data.game_players[channel_id]]:
+        if user_id in [str(pid) for pid in session.players]:
             # Ignore command prefix messages, let them be handled by process_commands
             if not message.content.startswith('!'):
-                await process_action(message)
+                if await acquire_quota(message):
+                    await process_action(message)
     
     # Ensure commands still work
     await bot.process_commands(message)
@@ -888,73 +2364,40 @@ async def process_action(message):
     channel_id = str(message.channel.id)
     
     # Validate game state
-    if channel_id not in game_data.active_games:
-        return
-    if channel_id not in game_data.game_states:
-        game_data.active_games.pop(channel_id, None)
+    session = game_data.get_session(channel_id)
+    if not session:
         return
         
-    current_state = game_data.game_states[channel_id]
-    if not isinstance(current_state, dict):
-        print(f"Invalid game state for channel {channel_id}")
-        return
-        
-    selected_lang = game_data.game_languages.get(channel_id, 'both')
+    current_state = session.state
+    selected_lang = game_data.get_language(channel_id)
     
     # Translate user input if needed
-    action_text = await process_user_input(message.content, selected_lang)
+    action_text = await process_user_input(message.content, selected_lang, channel_id)
     
-    completion_check_prompt = f"""
-Player action: {action_text}
-Current scene: {current_state['current_scene']}
-
-Main objective: {current_state['main_objective']}
-Required conditions: {current_state['key_requirements']}
-
-Strictly evaluate if this action contributes to or completes the objective.
-1. Check each requirement carefully
-2. Only mark as complete if ALL requirements are fully met
-3. If complete, explain how each requirement was met
-4. If not complete, explain what's still missing
-
-If ALL requirements are met, start response with [GAME_COMPLETE]
-Otherwise, evaluate the action and progress normally.
-"""
-
-    response = await get_larp_response(completion_check_prompt, current_state)
-    formatted_response = await format_output(response, selected_lang)
+    adjudication = await adjudicate_action(action_text, current_state, channel_id)
+    if adjudication['failed']:
+        # Leave the scene and story untouched so the player can simply try again
+        await send_ui_message(message.channel, SYSTEM_MESSAGES["turn_failed"], color=discord.Color.red())
+        return
+    narrative = adjudication['narrative']
+    update_objective_progress(current_state, adjudication['newly_met'])
     
-    if isinstance(formatted_response, str) and formatted_response.startswith("[GAME_COMPLETE]"):
-        await handle_game_completion(message.channel, channel_id, formatted_response)
-        
-        await send_message(
-            message.channel,
-            SYSTEM_MESSAGES["objectives_met"].format(
-                objective=current_state['main_objective']
-            ),
-            title=SYSTEM_MESSAGES["game_complete"],
-            color=discord.Color.gold()
-        )
-        
-        # Clean up game state
-        del game_data.active_games[channel_id]
-        del game_data.game_states[channel_id]
-        del game_data.game_players[channel_id]
-        if channel_id in game_data.game_objectives:
-            del game_data.game_objectives[channel_id]
-        game_data.save_data()
+    if adjudication['game_complete']:
+        session.story.append(StoryEvent(action_text, message.author.name, narrative))
+        await handle_game_completion(message.channel, channel_id, narrative)
     else:
-        current_state['current_scene'] = formatted_response
+        current_state.current_scene = narrative
         await update_story_message(
             message.channel, 
             channel_id, 
-            formatted_response, 
+            narrative, 
             action_text, 
             message.author.name
         )
+        game_data.save_data()
         await send_message(
             message.channel,
-            formatted_response,
+            narrative,
             title="Roleplay Response",
             color=discord.Color.green()
         )
@@ -965,10 +2408,12 @@ async def handle_game_completion(ctx, channel_id, final_scene):
         return
         
     try:
-        selected_lang = game_data.game_languages.get(channel_id, 'both')
+        final_content = final_scene if isinstance(final_scene, str) else str(final_scene)
         
-        # Ensure final_scene is a string before using replace
-        final_content = final_scene.replace("[GAME_COMPLETE]", "") if isinstance(final_scene, str) else str(final_scene)
+        # Stop accepting actions while the final messages are sent
+        session = game_data.sessions.get(channel_id)
+        if session:
+            session.active = False
         
         await send_message(
             ctx,
@@ -976,14 +2421,14 @@ async def handle_game_completion(ctx, channel_id, final_scene):
             title=SYSTEM_MESSAGES["game_complete"],
             color=discord.Color.gold()
         )
+        await send_ui_message(
+            ctx,
+            SYSTEM_MESSAGES["objectives_met"],
+            title=SYSTEM_MESSAGES["game_complete"],
+            color=discord.Color.gold()
+        )
         
-        # Clean up game state with checks
-        game_data.active_games.pop(channel_id, None)
-        game_data.game_states.pop(channel_id, None)
-        game_data.game_players.pop(channel_id, None)
-        game_data.game_objectives.pop(channel_id, None)
-        
-        game_data.save_data()
+        close_game(channel_id)
     except Exception as e:
         print(f"Error in handle_game_completion: {e}")
         try:
@@ -991,5 +2436,190 @@ async def handle_game_completion(ctx, channel_id, final_scene):
         except:
             print("Could not send error message")
 
+# Application commands and buttons
+INTERACTIONS_MODE = True  # Register slash commands and buttons, and show roles in private replies instead of DMs
+
+class InteractionContext:
+    """Command context that answers a deferred interaction through follow-up messages"""
+    def __init__(self, interaction, ephemeral=False, content=None):
+        self.interaction = interaction
+        self.ephemeral = ephemeral
+        self.channel = interaction.channel
+        self.guild = interaction.guild
+        self.author = interaction.user
+        self.content = content
+        self.message = self  # Commands read quota keys and add reactions through ctx.message
+
+    async def send(self, content=None, **kwargs):
+        """Send a follow-up and return it so it can be edited later"""
+        kwargs = {key: value for key, value in kwargs.items() if value is not None}
+        return await self.interaction.followup.send(content, ephemeral=self.ephemeral, wait=True, **kwargs)
+
+    async def add_reaction(self, emoji):
+        """Reply with the emoji, since there is no user message to react to"""
+        await self.send(emoji)
+
+async def run_deferred(interaction, command, ephemeral=False, content=None):
+    """Acknowledge an interaction at once, then run a command that replies through follow-ups"""
+    await interaction.response.defer(ephemeral=ephemeral, thinking=True)
+    ctx = InteractionContext(interaction, ephemeral, content)
+    try:
+        await command(ctx)
+    except Exception as e:
+        # Buttons have no command, so fall back to the component's custom ID
+        name = getattr(interaction.command, 'name', None) or (interaction.data or {}).get('custom_id')
+        print(f"Error in interaction {name}: {e}")
+        try:
+            await ctx.send("Error: Could not complete command")
+        except discord.HTTPException as e:
+            print(f"Could not send error follow-up for {name}: {e}")
+
+async def send_role(ctx):
+    """Show a player their character role"""
+    channel_id, selected_lang = get_channel_language(ctx)
+    session = game_data.get_session(channel_id)
+    role_info = session.characters.get(str(ctx.author.id)) if session else None
+    if role_info is None:
+        await send_ui_message(ctx, SYSTEM_MESSAGES["no_role"])
+        return
+
+    # Bilingual and Chinese channels translate the role
+    if not await acquire_quota(ctx.message):
+        return
+
+    formatted = await format_output(role_info, selected_lang, channel_id)
+    parts = formatted if isinstance(formatted, list) else [formatted]
+    embeds = [
+        discord.Embed(title="Your Character Role", description=part, color=discord.Color.blue())
+        for part in parts
+    ]
+    await ctx.send(embeds=embeds)
+
+async def take_action(ctx):
+    """Run a player's /act action through the same checks as channel messages"""
+    channel_id = str(ctx.channel.id)
+    session = game_data.get_session(channel_id)
+    if not session:
+        await send_ui_message(ctx, SYSTEM_MESSAGES["no_active_game"])
+        return
+    if str(ctx.author.id) not in [str(pid) for pid in session.players]:
+        await send_ui_message(ctx, SYSTEM_MESSAGES["not_a_player"])
+        return
+
+    if not await acquire_quota(ctx.message):
+        return
+
+    # Echo the action so the deferred reply resolves before the LLM answers in the channel
+    await ctx.send(f"👤 **{ctx.author.name}**: {ctx.content}")
+    await process_action(ctx)
+
+class JoinView(discord.ui.View):
+    """Persistent join button for the joining phase of setup"""
+    def __init__(self):
+        super().__init__(timeout=None)
+
+    @discord.ui.button(label="Join", emoji='👍', style=discord.ButtonStyle.primary, custom_id="larp:join")
+    async def join(self, interaction, button):
+        await interaction.response.defer()
+        if not await add_joined_player(interaction.channel, interaction.user):
+            await send_ui_message(InteractionContext(interaction, ephemeral=True), SYSTEM_MESSAGES["join_closed"])
+
+class RoleView(discord.ui.View):
+    """Persistent button that shows each player their own role privately"""
+    def __init__(self):
+        super().__init__(timeout=None)
+
+    @discord.ui.button(label="Reveal my role", emoji='🎭', style=discord.ButtonStyle.secondary, custom_id="larp:role")
+    async def reveal(self, interaction, button):
+        await run_deferred(interaction, send_role, ephemeral=True)
+
+@bot.tree.command(name="start_game", description="Start a new game in this channel")
+async def start_game_slash(interaction):
+    await run_deferred(interaction, start_game)
+
+@bot.tree.command(name="act", description="Take an action in the current game")
+async def act_slash(interaction, action: str):
+    await run_deferred(interaction, take_action, content=action)
+
+@bot.tree.command(name="scene", description="Review the current scene and objectives")
+async def scene_slash(interaction):
+    await run_deferred(interaction, get_current_scene)
+
+@bot.tree.command(name="story", description="View the story history")
+async def story_slash(interaction):
+    await run_deferred(interaction, show_story)
+
+@bot.tree.command(name="role", description="See your character role privately")
+async def role_slash(interaction):
+    await run_deferred(interaction, send_role, ephemeral=True)
+
+@bot.tree.command(name="end_game", description="End the game session")
+async def end_game_slash(interaction):
+    await run_deferred(interaction, end_game)
+
+@bot.command(name='sync')
+@commands.has_permissions(administrator=True)
+async def sync_commands(ctx):
+    """Register the slash commands with Discord after they change"""
+    try:
+        synced = await bot.tree.sync()
+    except discord.HTTPException as e:
+        await ctx.send(f"Error: Could not sync slash commands: {e}")
+        return
+    # Sent directly so admin reports never trigger translation
+    await ctx.send(f"Synced {len(synced)} slash commands")
+
+quota_flush_task = None  # Periodic quota save, started once the event loop runs
+
+@bot.event
+async def setup_hook():
+    """Start background work, then register persistent buttons and, if asked, sync slash commands"""
+    global quota_flush_task
+    quota_flush_task = asyncio.create_task(flush_quotas_periodically())
+    if not INTERACTIONS_MODE:
+        return
+    bot.add_view(JoinView())
+    bot.add_view(RoleView())
+    # Syncing is rate limited and only needed when commands change, so it is opt-in
+    if os.getenv('SYNC_COMMANDS') != '1':
+        return
+    started = time.perf_counter()
+    try:
+        await bot.tree.sync()
+    except discord.HTTPException as e:
+        print(f"Could not sync slash commands: {e}")
+    record_startup("sync slash commands", time.perf_counter() - started)
+
+# Application lifecycle
+STARTUP_STEPS = [
+    ("load environment", load_dotenv),
+    ("load game data", game_data.load_data),
+    ("load archive index", game_archive.load_index),
+    ("load quotas", quota_manager.load),
+    ("load locale catalog", locale_catalog.load),
+    ("load LLM routes", load_route_overrides)
+]
+startup_ready = None  # perf_counter value when startup() finished
+
+def startup():
+    """Load configuration and persistent data, recording how long each step takes"""
+    global startup_ready
+    for step, load in STARTUP_STEPS:
+        started = time.perf_counter()
+        load()
+        record_startup(step, time.perf_counter() - started)
+    startup_ready = time.perf_counter()
+    print(startup_report())
+
+def main():
+    """Start the bot"""
+    startup()
+    bot.run(os.getenv('DISCORD_TOKEN'))
+    game_data.save_data()
+    quota_manager.flush()
+    traffic_recorder.flush()
+
+record_startup("import modules", time.perf_counter() - STARTUP_BEGAN)
+
 if __name__ == "__main__":
-    bot.run(TOKEN) 
\ No newline at end of file
+    main() 
\ No newline at end of file
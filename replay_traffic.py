@@ -0,0 +1,262 @@
+"""Replay a recorded traffic log against the bot with a stub LLM and a fake Discord layer
+
+Record traffic by setting TRAFFIC_RECORDING = True in bot.py, then run:
+python replay_traffic.py traffic_log.jsonl [--speed 10] [--llm-latency 1.5] [--concurrency 6]
+"""
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+
+import discord
+
+import bot
+
+# Filler text used to rebuild messages of the recorded length and language
+ENGLISH_FILLER = "I search the room carefully and ask the guard about the missing key "
+CHINESE_FILLER = "我仔細搜查房間並詢問守衛關於失蹤鑰匙的事情"
+
+def load_events(log_file):
+    """Read a traffic log, placing each recording after the previous one"""
+    events = []
+    offset = 0.0
+    segment_end = 0.0
+    with open(log_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if isinstance(entry, dict):
+                # A new recording restarts its clock at zero
+                offset = segment_end
+                continue
+            seconds, channel, user, length, language, is_command = entry
+            events.append((offset + seconds, channel, user, length, language, is_command))
+            segment_end = offset + seconds
+    return events
+
+def make_content(length, language, is_command):
+    """Build message text with the recorded length and detected language"""
+    length = max(length, 1)
+    if language == 'zh':
+        text = CHINESE_FILLER * (length // len(CHINESE_FILLER) + 1)
+    elif language == 'mixed':
+        half = length // 2 + 1
+        text = (CHINESE_FILLER * (half // len(CHINESE_FILLER) + 1))[:half] + ENGLISH_FILLER * (half // len(ENGLISH_FILLER) + 1)
+    else:
+        text = ENGLISH_FILLER * (length // len(ENGLISH_FILLER) + 1)
+    text = text[:length]
+    return bot.bot.command_prefix + text[1:] if is_command else text
+
+class StubCompletions:
+    """Chat completions that sleep for a simulated latency and return canned text"""
+    def __init__(self, latency, rng):
+        self.latency = latency
+        self.rng = rng
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency * self.rng.uniform(0.5, 1.5))
+        if kwargs.get('response_format'):
+            content = json.dumps({
+                "narrative": "The guard hesitates, then points toward the locked archive.",
+                "requirements": [{"id": 1, "met": False, "reason": "Not yet"}],
+                "game_complete": False
+            })
+        else:
+            content = CHINESE_FILLER * 3
+        prompt_tokens = sum(len(m['content']) for m in kwargs['messages']) // 4
+        completion_tokens = len(content) // 4
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            )
+        )
+
+class FakeMessage:
+    """Message with just the attributes the bot reads"""
+    def __init__(self, message_id, channel, author, content, metrics):
+        self.id = message_id
+        self.channel = channel
+        self.author = author
+        self.guild = channel.guild
+        self.content = content
+        self.metrics = metrics
+        self.throttled = False
+
+    async def add_reaction(self, emoji):
+        if emoji == '⏳':
+            self.throttled = True
+            self.metrics['throttled'] += 1
+
+    async def edit(self, **kwargs):
+        self.metrics['edits'] += 1
+
+class FakeChannel(discord.TextChannel):
+    """Text channel that counts sent messages instead of calling Discord"""
+    def __init__(self, channel_id, guild, metrics):
+        self.id = channel_id
+        self.name = f"replay-{channel_id}"
+        self.guild = guild
+        self.metrics = metrics
+
+    async def send(self, content=None, **kwargs):
+        self.metrics['sent'] += 1
+        return FakeMessage(self.metrics['sent'], self, None, content, self.metrics)
+
+def percentile(values, fraction):
+    """Return a percentile of a list of numbers, or 0 if it is empty"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def isolate_files(directory):
+    """Point every file the bot writes at a scratch directory"""
+    bot.game_data.data_file = directory / "game_data.json"
+    bot.game_archive.archive_file = directory / "game_archive.bin"
+    bot.game_archive.index_file = directory / "game_archive_index.jsonl"
+    bot.quota_manager.data_file = directory / "quota_data.json"
+    bot.locale_catalog.catalog_file = directory / "locale_catalog.json"
+    bot.traffic_recorder.log_file = directory / "traffic_log.jsonl"
+
+def start_sessions(events, language, metrics):
+    """Create a live game for every recorded channel with its recorded users as players"""
+    guild = SimpleNamespace(id=1, name="replay")
+    players = {}
+    for _, channel, user, _, _, _ in events:
+        players.setdefault(channel, set()).add(user)
+
+    channels = {}
+    for channel, users in players.items():
+        channels[channel] = FakeChannel(1000 + channel, guild, metrics)
+        bot.game_data.sessions[str(1000 + channel)] = bot.GameSession(
+            [100000 + user for user in sorted(users)],
+            language,
+            bot.GameState("The party stands in a dusty archive.", "Recover the stolen key",
+                          ["Find the thief", "Open the vault", "Escape the city"])
+        )
+    return channels
+
+def instrument_scheduler(queue_delays):
+    """Record how long each LLM call waits in the scheduler before it starts"""
+    run = bot.llm_scheduler.run
+
+    async def timed_run(work_class, channel_id, func, **kwargs):
+        queued = time.perf_counter()
+
+        def timed(**call_kwargs):
+            queue_delays.setdefault(work_class, []).append(time.perf_counter() - queued)
+            return func(**call_kwargs)
+
+        return await run(work_class, channel_id, timed, **kwargs)
+
+    bot.llm_scheduler.run = timed_run
+
+async def replay(events, channels, speed, metrics, latencies):
+    """Deliver events on their recorded schedule and wait for all work to finish"""
+    authors = {}
+    tasks = []
+
+    async def deliver(message):
+        started = time.perf_counter()
+        await bot.on_message(message)
+        # Throttled actions and unreplayed commands return at once and would skew capacity figures
+        if not message.throttled and not message.content.startswith(bot.bot.command_prefix):
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for number, (seconds, channel, user, length, language, is_command) in enumerate(events):
+        delay = started + seconds / speed - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        author = authors.setdefault(user, SimpleNamespace(id=100000 + user, name=f"player{user}", bot=False))
+        message = FakeMessage(number, channels[channel], author, make_content(length, language, is_command), metrics)
+        tasks.append(asyncio.create_task(deliver(message)))
+
+    await asyncio.gather(*tasks)
+    while bot.pending_translations:
+        await asyncio.gather(*list(bot.pending_translations))
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('log_file', type=Path, help="Traffic log written by the bot")
+    parser.add_argument('--speed', type=float, default=1.0, help="Replay speed multiplier (1-50)")
+    parser.add_argument('--llm-latency', type=float, default=1.5, help="Mean stub LLM latency in seconds")
+    parser.add_argument('--concurrency', type=int, default=bot.LLM_MAX_CONCURRENCY, help="Maximum concurrent LLM calls")
+    parser.add_argument('--language', choices=['en', 'zh', 'both'], default='both', help="Language of the replayed games")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for stub LLM latency")
+    parser.add_argument('--no-quotas', action='store_true', help="Admit every event instead of applying QUOTA_LIMITS")
+    args = parser.parse_args()
+    if not 1 <= args.speed <= 50:
+        parser.error("--speed must be between 1 and 50")
+
+    events = load_events(args.log_file)
+    if not events:
+        parser.error(f"No events in {args.log_file}")
+
+    metrics = {'sent': 0, 'edits': 0, 'throttled': 0}
+    latencies = []
+    queue_delays = {}
+    completions = StubCompletions(args.llm_latency, random.Random(args.seed))
+
+    with tempfile.TemporaryDirectory() as scratch:
+        isolate_files(Path(scratch))
+        bot.TRAFFIC_RECORDING = False  # Never record the replayed traffic, least of all into the log being replayed
+        bot.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        bot.bot.process_commands = lambda message: asyncio.sleep(0)  # Commands are not replayed
+        bot.llm_scheduler.max_concurrency = args.concurrency
+        if args.no_quotas:
+            bot.quota_manager.try_acquire = lambda keys: True
+        instrument_scheduler(queue_delays)
+        channels = start_sessions(events, args.language, metrics)
+
+        # Load numpy before tracing so its one-off allocations are not counted as growth
+        bot.embed_text("warm up")
+
+        # Only allocations made during the replay are traced, so these are growth figures
+        tracemalloc.start()
+        elapsed = asyncio.run(replay(events, channels, args.speed, metrics, latencies))
+        memory_retained, memory_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    languages = {}
+    for event in events:
+        languages[event[4]] = languages.get(event[4], 0) + 1
+    recorded = events[-1][0] / args.speed
+
+    print(f"{len(events)} events in {len(channels)} channels at {args.speed:g}x "
+          f"({recorded:.1f}s of traffic), stub LLM {args.llm_latency:g}s, concurrency {args.concurrency}")
+    print("Language mix: " + ", ".join(f"{lang} {count}" for lang, count in sorted(languages.items())))
+    print("Quotas:             " + ("off" if args.no_quotas else
+          f"on, {metrics['throttled']} events throttled (use --no-quotas to measure raw capacity)"))
+    print(f"\nWall time:          {elapsed:.1f}s")
+    print(f"Throughput:         {len(latencies) / elapsed:.2f} actions/s, {completions.calls / elapsed:.2f} LLM calls/s")
+    print(f"Action time:        p50 {percentile(latencies, 0.5):.2f}s  p95 {percentile(latencies, 0.95):.2f}s  "
+          f"max {max(latencies, default=0):.2f}s  ({len(latencies)} actions)")
+    print(f"Messages:           {metrics['sent']} sent, {metrics['edits']} edited")
+    print(f"Memory growth:      {memory_retained / 1024:.0f} KiB retained, {memory_peak / 1024:.0f} KiB peak, "
+          f"{memory_retained / len(events):.0f} B/event")
+
+    print(f"\n{'LLM queueing delay':20}{'calls':>8}{'p50':>9}{'p95':>9}{'max':>9}")
+    for work_class in sorted(queue_delays, key=bot.LLM_PRIORITIES.get):
+        delays = queue_delays[work_class]
+        print(f"{work_class:20}{len(delays):>8}{percentile(delays, 0.5):>8.2f}s"
+              f"{percentile(delays, 0.95):>8.2f}s{max(delays):>8.2f}s")
+
+    print("\nRoutes:")
+    for route in bot.LLM_ROUTES:
+        print(f"  {route:14}{bot.route_stats.summary(route)}")
+
+if __name__ == "__main__":
+    main()
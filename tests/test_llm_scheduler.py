@@ -0,0 +1,70 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("discord")
+pytest.importorskip("dotenv")
+
+import bot
+
+
+def test_class_limit_holds_when_callers_are_cancelled():
+    scheduler = bot.LLMScheduler({"turn": 0}, {"turn": 1}, 6)
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def slow_call():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.2)
+        with lock:
+            running[0] -= 1
+
+    async def main():
+        calls = [
+            asyncio.wait_for(scheduler.run("turn", str(i), slow_call), 0.05 * (i + 1))
+            for i in range(3)
+        ]
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        assert all(isinstance(r, asyncio.TimeoutError) for r in results)
+
+        # The first call keeps running in its thread after its caller timed out
+        while scheduler.total_running:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert peak[0] == 1
+    assert scheduler.running["turn"] == 0
+
+
+def test_concurrency_is_not_capped_by_the_default_executor():
+    # More than the default executor's min(32, cpu + 4) threads on any host
+    limit = 40
+    scheduler = bot.LLMScheduler({"turn": 0}, {"turn": limit}, limit)
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def slow_call():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.2)
+        with lock:
+            running[0] -= 1
+
+    async def main():
+        await asyncio.gather(*(scheduler.run("turn", str(i), slow_call) for i in range(limit)))
+
+    asyncio.run(main())
+    assert peak[0] == limit
+
+
+def test_resizing_the_limit_resizes_the_pool():
+    scheduler = bot.LLMScheduler({"turn": 0}, {"turn": 50}, 4)
+    scheduler.max_concurrency = 50
+    assert scheduler.executor._max_workers == 50
@@ -0,0 +1,123 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("discord")
+pytest.importorskip("dotenv")
+
+import discord
+
+import bot
+
+
+class FakeChannel(discord.TextChannel):
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content or kwargs)
+
+
+@pytest.fixture
+def setup_env(monkeypatch, tmp_path):
+    game_data = bot.GameData()
+    game_data.data_file = tmp_path / "game_data.json"
+    monkeypatch.setattr(bot, "game_data", game_data)
+    monkeypatch.setattr(bot, "SETUP_RETRY_DELAY", 0)
+    monkeypatch.setattr(bot, "SETUP_MAX_RETRIES", 2)
+    game_data.setup_sessions["7"] = {
+        'phase': "scenario", 'joined_players': [1, 2], 'game_type': "mystery", 'language': 'en'
+    }
+    return game_data
+
+
+def test_failed_llm_steps_are_retried_and_never_checkpointed(monkeypatch, setup_env):
+    calls = []
+
+    async def failing(prompt, game_state=None, route="adjudication", channel_id=None, json_mode=False):
+        calls.append(route)
+        return bot.AI_ERROR_RESPONSE
+
+    monkeypatch.setattr(bot, "get_larp_response", failing)
+    channel = FakeChannel(7)
+    asyncio.run(bot.run_setup(channel, "7"))
+
+    # One attempt plus SETUP_MAX_RETRIES retries, then setup pauses with its checkpoint kept
+    assert calls == ["scenario"] * 3
+    assert "7" not in setup_env.sessions
+    saved = json.loads(setup_env.data_file.read_text()) if setup_env.data_file.exists() else {}
+    assert 'initial_story' not in setup_env.setup_sessions["7"]
+    assert 'initial_story' not in saved.get('setup_sessions', {}).get("7", {})
+
+
+def test_unparseable_objectives_are_retried(monkeypatch, setup_env):
+    replies = iter([
+        "A story",
+        "not json",
+        '{"main_objective": "Find the key", "key_requirements": ["a", "b"]}',
+        "Role 1",
+        "Role 2",
+    ])
+    calls = []
+
+    async def flaky(prompt, game_state=None, route="adjudication", channel_id=None, json_mode=False):
+        calls.append(route)
+        return next(replies)
+
+    monkeypatch.setattr(bot, "get_larp_response", flaky)
+    asyncio.run(bot.run_setup(FakeChannel(7), "7"))
+
+    assert calls == ["scenario", "objectives", "objectives", "roles", "roles"]
+    session = setup_env.sessions["7"]
+    assert session.state.main_objective == "Find the key"
+    assert session.state.key_requirements == ["a", "b"]
+    assert session.characters == {"1": "Role 1", "2": "Role 2"}
+
+
+@pytest.mark.parametrize("reachable", [True, False])
+def test_not_found_drops_setup_only_when_the_channel_is_gone(monkeypatch, setup_env, reachable):
+    calls = []
+
+    async def missing(channel, channel_id, session):
+        calls.append(channel_id)
+        raise discord.NotFound("Unknown Message")
+
+    async def fetch_channel(channel_id):
+        if not reachable:
+            raise discord.NotFound("Unknown Channel")
+        return FakeChannel(channel_id)
+
+    monkeypatch.setitem(bot.SETUP_PHASE_HANDLERS, "scenario", missing)
+    monkeypatch.setattr(bot.bot, "fetch_channel", fetch_channel, raising=False)
+    asyncio.run(bot.run_setup(FakeChannel(7), "7"))
+
+    if reachable:
+        # A missing message is retried like any other failure and the setup is kept
+        assert len(calls) == 3
+        assert "7" in setup_env.setup_sessions
+    else:
+        assert len(calls) == 1
+        assert "7" not in setup_env.setup_sessions
+
+
+def test_deleted_player_is_skipped_when_sending_roles(monkeypatch, setup_env):
+    async def roles(prompt, game_state=None, route="adjudication", channel_id=None, json_mode=False):
+        return "A role"
+
+    async def deleted(user_id):
+        raise discord.NotFound("Unknown User")
+
+    setup_env.setup_sessions["7"].update(
+        phase="roles", roles={}, roles_sent=[],
+        game_state=bot.GameState("A story", "Find the key", ["a"]).to_dict()
+    )
+    monkeypatch.setattr(bot, "get_larp_response", roles)
+    monkeypatch.setattr(bot, "INTERACTIONS_MODE", False)
+    monkeypatch.setattr(bot.user_resolver, "get_user", deleted)
+    channel = FakeChannel(7)
+    asyncio.run(bot.run_setup(channel, "7"))
+
+    assert "7" in setup_env.sessions
+    assert "7" not in setup_env.setup_sessions